@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # the warm-up is off by default so management commands do not pay for it
+        if getattr(settings, "ILLOYD_WARMUP", False):
+            from . import startup
+            startup.warm_up()
@@ -0,0 +1,112 @@
+import random
+from . import helper
+
+
+class BeachLine:
+    # arcs ordered by y along the sweep line, kept both as the prev/next linked list used by the
+    # sweep and as a treap so the arc above a new site is found in O(log n)
+
+    def __init__(self, seed=None):
+        self.root = None
+        self.head = None
+        self.tail = None
+        self.random = random.Random(seed)
+
+    def empty(self):
+        return self.root is None
+
+    def locate(self, point):
+        # descend comparing the site with the breakpoints around each arc at the sweep position point.x
+        node = self.root
+        while node is not None:
+            if node.prev is not None and point.y < helper.intersection(node.prev.point, node.point, point.x).y:
+                node = node.left
+            elif node.next is not None and point.y > helper.intersection(node.point, node.next.point, point.x).y:
+                node = node.right
+            else:
+                return node
+        return None
+
+    def insert_after(self, arc, new_arc):
+        # link new_arc right after arc, or as the only arc if arc is None
+        new_arc.priority = self.random.random()
+        new_arc.left = new_arc.right = None
+
+        if arc is None:
+            new_arc.prev = new_arc.next = new_arc.parent = None
+            self.root = self.head = self.tail = new_arc
+            return new_arc
+
+        new_arc.prev, new_arc.next = arc, arc.next
+        if arc.next is not None:
+            arc.next.prev = new_arc
+        else:
+            self.tail = new_arc
+        arc.next = new_arc
+
+        # the in-order successor slot of arc is its right child or the leftmost node of its right subtree
+        if arc.right is None:
+            arc.right = new_arc
+        else:
+            node = arc.right
+            while node.left is not None:
+                node = node.left
+            node.left = new_arc
+            arc = node
+        new_arc.parent = arc
+
+        while new_arc.parent is not None and new_arc.priority < new_arc.parent.priority:
+            self.rotate_up(new_arc)
+
+        return new_arc
+
+    def remove(self, arc):
+        # unlink arc, its own prev/next are left in place for the caller
+        if arc.prev is not None:
+            arc.prev.next = arc.next
+        else:
+            self.head = arc.next
+        if arc.next is not None:
+            arc.next.prev = arc.prev
+        else:
+            self.tail = arc.prev
+
+        # rotate arc down to a leaf, then cut it off
+        while arc.left is not None or arc.right is not None:
+            if arc.right is None or (arc.left is not None and arc.left.priority < arc.right.priority):
+                self.rotate_up(arc.left)
+            else:
+                self.rotate_up(arc.right)
+
+        parent = arc.parent
+        if parent is None:
+            self.root = None
+        elif parent.left is arc:
+            parent.left = None
+        else:
+            parent.right = None
+        arc.parent = None
+
+    def rotate_up(self, node):
+        parent = node.parent
+        grandparent = parent.parent
+
+        if parent.left is node:
+            parent.left = node.right
+            if node.right is not None:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left is not None:
+                node.left.parent = parent
+            node.left = parent
+
+        parent.parent = node
+        node.parent = grandparent
+        if grandparent is None:
+            self.root = node
+        elif grandparent.left is parent:
+            grandparent.left = node
+        else:
+            grandparent.right = node
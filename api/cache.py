@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import struct
+import threading
+import numpy as np
+from . import metrics
+
+
+def key(algorithm, points, bounds, *extra):
+    # hash of the canonical request: algorithm, points as contiguous little-endian float64
+    # (with -0.0 folded into 0.0), the boundary box and any extra strings
+    canonical = np.ascontiguousarray(points, dtype="<f8") + 0.0
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(algorithm.encode("utf-8"))
+    digest.update(struct.pack("<q", canonical.shape[0]))
+    digest.update(struct.pack("<4d", *bounds))
+    digest.update(canonical.data)
+    for part in extra:
+        digest.update(b"\0" + part.encode("utf-8"))
+    return f"illoyd:{algorithm}:{digest.hexdigest()}"
+
+
+class ResultCache:
+    # results as dicts of numpy arrays, in a size bounded LRU in the worker and optionally
+    # in a django cache backend shared between workers
+    def __init__(self, max_bytes, alias=None, timeout=None, name="cache"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.alias = alias
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None and self.shared() is not None:
+            entry = self.shared().get(key)
+            if entry is not None:
+                self.remember(key, entry)
+
+        metrics.registry.increment(f"{self.name}.hits" if entry is not None else f"{self.name}.misses")
+        return entry
+
+    def put(self, key, arrays):
+        entry = {}
+        for name, array in arrays.items():
+            entry[name] = np.ascontiguousarray(array)
+            entry[name].setflags(write=False)
+
+        self.remember(key, entry)
+        if self.shared() is not None:
+            self.shared().set(key, entry, self.timeout)
+
+    def remember(self, key, entry):
+        nbytes = sum(array.nbytes for array in entry.values())
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= sum(array.nbytes for array in self.entries.pop(key).values())
+            self.entries[key] = entry
+            self.size += nbytes
+
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sum(array.nbytes for array in evicted.values())
+                metrics.registry.increment(f"{self.name}.evictions")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+results = ResultCache(
+    getattr(settings, "ILLOYD_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+    getattr(settings, "ILLOYD_RESULT_CACHE_ALIAS", None),
+    getattr(settings, "ILLOYD_RESULT_CACHE_TIMEOUT", 3600),
+)
@@ -0,0 +1,251 @@
+import itertools
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+
+def outer_box(points, bounds):
+    # box containing the boundary and every site with some slack, so every site is strictly inside
+    min_x, min_y, max_x, max_y = bounds
+    lo = np.minimum([min_x, min_y], points.min(axis=0))
+    hi = np.maximum([max_x, max_y], points.max(axis=0))
+    margin = (hi - lo).max() / 10.0 + 1.0
+    return lo - margin, hi + margin
+
+
+def ridge_vertices(vor):
+    # the vertex pairs of every ridge as an array, -1 for the missing end of semi-infinite ones.
+    # read from the flat list, which is several times faster than converting the list of lists
+    flat = np.fromiter(itertools.chain.from_iterable(vor.ridge_vertices), dtype=np.intp, count=2 * len(vor.ridge_vertices))
+    return flat.reshape(-1, 2)
+
+
+def closed_cells(vor, bounds, regions):
+    # build each of the given regions as a convex polygon that covers its cell inside the boundary,
+    # unbounded regions are closed with far points on their rays and the outer box corners they own.
+    # returns the padded vertex array (regions x width x 2), vertex counts and the site each row is sorted around
+    points = vor.points
+    n_rows = len(regions)
+
+    row_of = np.full(len(vor.regions), -1, dtype=np.intp)
+    row_of[regions] = np.arange(n_rows)
+    site_of = np.empty(len(vor.regions), dtype=np.intp)
+    site_of[vor.point_region] = np.arange(len(points))
+    origin = points[site_of[regions]]
+
+    lo, hi = outer_box(points, bounds)
+
+    # finite vertices of each region
+    selected = [vor.regions[region_idx] for region_idx in regions]
+    lengths = np.fromiter(map(len, selected), dtype=np.intp, count=n_rows)
+    flat = np.fromiter(itertools.chain.from_iterable(selected), dtype=np.intp, count=lengths.sum())
+    rows = np.repeat(np.arange(n_rows), lengths)
+    keep = flat != -1
+    owners = [rows[keep]]
+    coords = [vor.vertices[flat[keep]]]
+
+    # semi-infinite ridges, extended far enough to leave the outer box and shared by both adjacent regions
+    ridge_points = np.asarray(vor.ridge_points)
+    infinite = (ridge_vertices(vor) == -1).any(axis=1)
+    infinite &= (row_of[vor.point_region[ridge_points]] >= 0).any(axis=1)
+    if infinite.any():
+        p1, p2 = ridge_points[infinite].T
+        far = far_points(vor, np.flatnonzero(infinite), lo, hi)
+
+        for ends in (p1, p2):
+            ray_rows = row_of[vor.point_region[ends]]
+            owners.append(ray_rows[ray_rows >= 0])
+            coords.append(far[ray_rows >= 0])
+
+    owners = np.concatenate(owners)
+    coords = np.concatenate(coords)
+
+    # each outer box corner belongs to the region of its nearest site
+    corners = box_corners(lo, hi)
+    corner_rows = row_of[vor.point_region[nearest_sites(points, corners)]]
+
+    polygons, counts = convex_polygons(origin, owners, coords, corners, corner_rows)
+    return polygons, counts, origin
+
+
+def far_points(vor, ridges, lo, hi):
+    # far end of the given semi-infinite ridges, on their ray and outside the box lo, hi
+    points = vor.points
+    p1, p2 = np.asarray(vor.ridge_points)[ridges].T
+    # semi-infinite ridges are few, their finite vertex is picked out of the list directly
+    v_finite = vor.vertices[np.fromiter((max(vor.ridge_vertices[ridge]) for ridge in ridges), dtype=np.intp, count=len(ridges))]
+
+    t = points[p2] - points[p1]
+    t /= np.hypot(*t.T)[:, None]
+    n = np.column_stack((-t[:, 1], t[:, 0]))
+
+    midpoint = (points[p1] + points[p2]) / 2.0
+    side = np.sign(np.einsum("ij,ij->i", midpoint - points.mean(axis=0), n))
+    side[side == 0] = 1.0
+
+    ray_length = np.hypot(*(v_finite - (lo + hi) / 2.0).T) + np.hypot(*(hi - lo))
+    return v_finite + (side * ray_length)[:, None] * n
+
+
+def box_corners(lo, hi):
+    return np.array([[lo[0], lo[1]], [hi[0], lo[1]], [hi[0], hi[1]], [lo[0], hi[1]]])
+
+
+def nearest_sites(points, targets):
+    return np.array([np.argmin(((points - target) ** 2).sum(axis=1)) for target in targets], dtype=np.intp)
+
+
+def convex_polygons(origin, owners, coords, corners, corner_rows):
+    # padded polygons (rows x width x 2) and vertex counts from the vertices owned by each row, the
+    # rows are convex cells around their origin site. a corner can fall inside the polygon of the
+    # row's other vertices, so the few rows owning corners are rebuilt from their hull
+    n_rows = len(origin)
+
+    for row in np.unique(corner_rows[corner_rows >= 0]):
+        mask = owners == row
+        candidates = np.concatenate((coords[mask], corners[corner_rows == row]))
+        try:
+            candidates = candidates[ConvexHull(candidates).vertices]
+        except QhullError:
+            pass
+
+        owners = np.concatenate((owners[~mask], np.full(len(candidates), row)))
+        coords = np.concatenate((coords[~mask], candidates))
+
+    # cells are convex and contain their site, so sorting by angle around the site gives the vertex order
+    offset = coords - origin[owners]
+    order = np.lexsort((np.arctan2(offset[:, 1], offset[:, 0]), owners))
+    owners, coords = owners[order], coords[order]
+
+    counts = np.bincount(owners, minlength=n_rows)
+    width = max(int(counts.max()), 1)
+    starts = np.cumsum(counts) - counts
+    position = np.arange(len(owners)) - starts[owners]
+
+    # pad short rows by repeating their last vertex, which only adds zero-length edges
+    polygons = np.repeat(origin[:, None, :], width, axis=1)
+    polygons[owners, position] = coords
+    last = np.maximum(counts - 1, 0)
+    pad = np.arange(width)[None, :] > last[:, None]
+    polygons[pad] = np.repeat(polygons[np.arange(n_rows), last], width - last - 1, axis=0)
+
+    return polygons, counts
+
+
+def clip_half_plane(polygons, counts, axis, value, sign):
+    # vectorized sutherland-hodgman step keeping sign * (p[axis] - value) >= 0
+    start = polygons
+    end = np.roll(polygons, -1, axis=1)
+    start_in = sign * (start[..., axis] - value) >= 0
+    end_in = sign * (end[..., axis] - value) >= 0
+
+    delta = end[..., axis] - start[..., axis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(delta != 0, (value - start[..., axis]) / delta, 0.0)
+    crossing = start + t[..., None] * (end - start)
+
+    # every edge emits its crossing point (if any) followed by its end point (if inside)
+    candidates = np.stack((crossing, end), axis=2).reshape(len(polygons), -1, 2)
+    valid = np.stack((start_in != end_in, end_in), axis=2).reshape(len(polygons), -1)
+    valid &= (counts > 0)[:, None]
+
+    new_counts = valid.sum(axis=1)
+    width = max(int(new_counts.max()), 1)
+    order = np.argsort(~valid, axis=1, kind="stable")[:, :width]
+    index = np.minimum(np.arange(width)[None, :], np.maximum(new_counts - 1, 0)[:, None])
+    order = np.take_along_axis(order, index, axis=1)
+
+    return np.take_along_axis(candidates, order[..., None], axis=1), new_counts
+
+
+def clip_segments(segments, bounds):
+    # liang-barsky clipping of (start, end) segments to the box, returns the clipped segments that
+    # still reach into it and the mask of those among the input
+    start = segments[:, 0]
+    delta = segments[:, 1] - start
+    enter = np.zeros(len(segments))
+    leave = np.ones(len(segments))
+    keep = np.ones(len(segments), dtype=bool)
+
+    min_x, min_y, max_x, max_y = bounds
+    for axis, value, sign in ((0, min_x, 1.0), (0, max_x, -1.0), (1, min_y, 1.0), (1, max_y, -1.0)):
+        # inside while sign * (start + t * delta - value) >= 0
+        rate = sign * delta[:, axis]
+        offset = sign * (start[:, axis] - value)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = -offset / rate
+        enter = np.where(rate > 0, np.maximum(enter, t), enter)
+        leave = np.where(rate < 0, np.minimum(leave, t), leave)
+        keep &= (rate != 0) | (offset >= 0)
+
+    keep &= enter <= leave
+    clipped = start[keep, None, :] + np.stack((enter[keep], leave[keep]), axis=1)[..., None] * delta[keep, None, :]
+    return clipped, keep
+
+
+def clip_to_box(polygons, counts, bounds):
+    min_x, min_y, max_x, max_y = bounds
+    for axis, value, sign in ((0, min_x, 1.0), (0, max_x, -1.0), (1, min_y, 1.0), (1, max_y, -1.0)):
+        polygons, counts = clip_half_plane(polygons, counts, axis, value, sign)
+    return polygons, counts
+
+
+def polygon_moments(polygons, counts, origin):
+    # shoelace formula on coordinates relative to the site: centroid, area and second moment of area
+    # about the site (the cell's share of the CVT energy), empty polygons fall back to the site
+    local = polygons - origin[:, None, :]
+    following = np.roll(local, -1, axis=1)
+    cross = local[..., 0] * following[..., 1] - following[..., 0] * local[..., 1]
+
+    area = cross.sum(axis=1) / 2.0
+    moment = ((local + following) * cross[..., None]).sum(axis=1) / 6.0
+    inertia = (cross * (local * local + local * following + following * following).sum(axis=2)).sum(axis=1) / 12.0
+
+    degenerate = (counts < 3) | (area == 0.0)
+    safe_area = np.where(degenerate, 1.0, area)
+    centroids = origin + np.where(degenerate[:, None], 0.0, moment / safe_area[:, None])
+
+    return centroids, np.where(degenerate, 0.0, np.abs(area)), np.where(degenerate, 0.0, np.abs(inertia))
+
+
+def polygon_centroids(polygons, counts, origin):
+    centroids, areas, _ = polygon_moments(polygons, counts, origin)
+    return centroids, areas
+
+
+def cell_centroids(vor, bounds, sites=None, density=None):
+    # centroid and area of the cells of the given sites (all by default) clipped to the boundary box
+    centroids, areas, _ = cell_moments(vor, bounds, sites, density)
+    return centroids, areas
+
+
+def cell_moments(vor, bounds, sites=None, density=None):
+    # centroid, area and second moment about the site of the cells of the given sites, clipped to the
+    # box. with a density.Density they are weighted, and the area becomes the mass of the cell. with a
+    # domain.Domain they are clipped to its polygon instead
+    site_regions = vor.point_region if sites is None else vor.point_region[sites]
+    regions = np.unique(site_regions)
+
+    polygons, counts, origin = closed_cells(vor, bounds, regions)
+    centroids, areas, inertia = clipped_moments(polygons, counts, origin, bounds, density)
+
+    rows = np.searchsorted(regions, site_regions)
+    return centroids[rows], areas[rows], inertia[rows]
+
+
+def clipped_moments(polygons, counts, origin, bounds, density=None):
+    # centroid, area and second moment of every polygon clipped to the boundary box, weighted by the
+    # density when there is one. a domain.Domain clips the cells to its polygon itself
+    if getattr(density, "clips", False):
+        return density.moments(polygons, counts, origin)
+
+    moments = polygon_moments if density is None else density.moments
+    centroids, areas, inertia = moments(polygons, counts, origin)
+
+    # cells lying fully inside the box are already exact, only the ones reaching outside get clipped
+    min_x, min_y, max_x, max_y = bounds
+    outside = ((polygons < [min_x, min_y]) | (polygons > [max_x, max_y])).any(axis=(1, 2))
+    if outside.any():
+        clipped, clipped_counts = clip_to_box(polygons[outside], counts[outside], bounds)
+        centroids[outside], areas[outside], inertia[outside] = moments(clipped, clipped_counts, origin[outside])
+
+    return centroids, areas, inertia
@@ -0,0 +1,58 @@
+import numpy as np
+from . import clipping
+
+
+class HalfEdges:
+    # half-edge structure of a voronoi diagram built from its edges and the two sites each one
+    # separates. half-edges 2k and 2k + 1 run along edge k in opposite directions, face is the site
+    # of the cell on the left of a half-edge and next the following half-edge counterclockwise around
+    # that cell. open cells have a gap in their cycle where they leave the swept area
+    def __init__(self, edges, edge_sites, sites):
+        edges = np.asarray(edges, dtype=float).reshape(-1, 2, 2)
+        start, end = edges[:, 0], edges[:, 1]
+        a, b = np.asarray(edge_sites, dtype=np.intp).reshape(-1, 2).T
+
+        # the site on the left of start -> end owns the forward half-edge
+        direction = end - start
+        offset = sites[a] - start
+        left = direction[:, 0] * offset[:, 1] - direction[:, 1] * offset[:, 0] > 0
+
+        self.sites = sites
+        self.origin = edges.reshape(-1, 2)
+        self.twin = np.arange(len(self.origin)) ^ 1
+        self.face = np.column_stack((np.where(left, a, b), np.where(left, b, a))).ravel()
+
+        # the half-edges of a cell in counterclockwise order of their midpoints around its site
+        middle = (self.origin + self.origin[self.twin]) / 2.0 - sites[self.face]
+        order = np.lexsort((np.arctan2(middle[:, 1], middle[:, 0]), self.face))
+        counts = np.bincount(self.face, minlength=len(sites))
+        starts = np.cumsum(counts) - counts
+        position = np.arange(len(order)) - starts[self.face[order]]
+        following = starts[self.face[order]] + (position + 1) % counts[self.face[order]]
+
+        self.next = np.empty(len(order), dtype=np.intp)
+        self.next[order] = order[following]
+
+    def destination(self):
+        return self.origin[self.twin]
+
+    def cell_vertices(self):
+        # (face, vertex) pairs of every cell: the origin of each of its half-edges, and the
+        # destination of those that do not continue where the next one starts (the ends of a gap)
+        destination = self.destination()
+        gap = (destination != self.origin[self.next]).any(axis=1)
+        owners = np.concatenate((self.face, self.face[gap]))
+        coords = np.concatenate((self.origin, destination[gap]))
+        return owners, coords
+
+    def cell_centroids(self, bounds, density=None):
+        # centroid and area of every cell clipped to the boundary box, weighted by the density if any.
+        # open cells are closed by the corners of an outer box, as on the qhull path
+        owners, coords = self.cell_vertices()
+        lo, hi = clipping.outer_box(self.sites, bounds)
+        corners = clipping.box_corners(lo, hi)
+        corner_rows = clipping.nearest_sites(self.sites, corners)
+
+        polygons, counts = clipping.convex_polygons(self.sites, owners, coords, corners, corner_rows)
+        centroids, areas, _ = clipping.clipped_moments(polygons, counts, self.sites, bounds, density)
+        return centroids, areas
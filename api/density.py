@@ -0,0 +1,148 @@
+from django.conf import settings
+import numpy as np
+from . import cache
+from . import clipping
+
+MAX_PIXELS = 1 << 22
+
+
+def tables(values):
+    # per row prefix sums of the density and of its first and second moment along x, in pixel units:
+    # mass[r, c] is the integral of f over row r from 0 to c, first and second weight it by x and x * x
+    columns = np.arange(values.shape[1])
+    prefix = lambda weighted: np.concatenate((np.zeros((len(values), 1)), np.cumsum(weighted, axis=1)), axis=1)
+    return {
+        "values": values,
+        "mass": prefix(values),
+        "first": prefix(values * (2 * columns + 1) / 2.0),
+        "second": prefix(values * (3 * columns * (columns + 1) + 1) / 3.0),
+    }
+
+
+def split(start, end, axis, size):
+    # cut segments where they cross the lines at integers 0 to size along the axis. returns the
+    # pieces in order along each segment and the segment each one comes from
+    delta = end - start
+    lo = np.minimum(start[:, axis], end[:, axis])
+    hi = np.maximum(start[:, axis], end[:, axis])
+    first = np.maximum(np.floor(lo) + 1, 0)
+    last = np.minimum(np.ceil(hi) - 1, size)
+    crossings = np.maximum(last - first + 1, 0).astype(np.intp)
+
+    segment = np.repeat(np.arange(len(start)), crossings + 1)
+    position = np.arange(len(segment)) - np.repeat(np.cumsum(crossings + 1) - crossings - 1, crossings + 1)
+    line = np.where(delta[segment, axis] > 0, first[segment] + position, last[segment] - position)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stop = np.where(position < crossings[segment], (line - start[segment, axis]) / delta[segment, axis], 1.0)
+    begin = np.where(position > 0, np.roll(stop, 1), 0.0)
+
+    return start[segment] + begin[:, None] * delta[segment], start[segment] + stop[:, None] * delta[segment], segment
+
+
+class Density:
+    # a raster density over a box, row 0 along min_y and column 0 along min_x, with its prefix tables.
+    # outside the box the density is zero
+    def __init__(self, key, entry):
+        self.key = key
+        self.bounds = tuple(entry["bounds"])
+        self.values = entry["values"]
+        self.mass = entry["mass"]
+        self.first = entry["first"]
+        self.second = entry["second"]
+        self.rows, self.columns = self.values.shape
+        self.scale = (np.array(self.bounds[2:]) - self.bounds[:2]) / [self.columns, self.rows]
+
+    def at(self, points):
+        # density at the given points
+        pixel = np.floor((points - self.bounds[:2]) / self.scale).astype(np.intp)
+        inside = ((pixel >= 0) & (pixel < [self.columns, self.rows])).all(axis=1)
+        result = np.zeros(len(points))
+        result[inside] = self.values[pixel[inside, 1], pixel[inside, 0]]
+        return result
+
+    def moments(self, polygons, counts, origin):
+        # weighted centroid, mass and second moment about the site of every polygon, same layout as
+        # clipping.polygon_moments. by green's theorem the integrals over a polygon are integrals of
+        # the prefix tables along its edges, so the cost follows the perimeter in pixels, not the area.
+        # polygons without mass keep their unweighted centroid
+        low = np.array(self.bounds[:2])
+        start = (polygons - low) / self.scale
+        end = np.roll(start, -1, axis=1)
+        owner = np.repeat(np.arange(len(polygons)), polygons.shape[1])
+        start, end = start.reshape(-1, 2), end.reshape(-1, 2)
+
+        # edges along x add nothing to integrals over y. the others are cut at the pixel lines, so
+        # every piece lies in one pixel, pieces outside the rows of the raster carry no density
+        moving = end[:, 1] != start[:, 1]
+        start, end, pieces = split(start[moving], end[moving], 1, self.rows)
+        row = np.floor((start[:, 1] + end[:, 1]) / 2.0).astype(np.intp)
+        keep = (row >= 0) & (row < self.rows)
+        start, end, pieces, row = start[keep], end[keep], pieces[keep], row[keep]
+        start, end, cut = split(start, end, 0, self.columns)
+        owner = owner[moving][pieces][cut]
+        row = row[cut]
+
+        # f is constant on a piece, so the integrals of f, x f and x x f along the row from 0 to u are
+        # polynomials in u, and their means along the piece follow from its middle and extent. beyond
+        # the raster columns they stay constant
+        middle = (start + end) / 2.0
+        du, dv = (end - start).T
+        column = np.clip(np.floor(middle[:, 0]).astype(np.intp), 0, self.columns - 1)
+        outside = (middle[:, 0] < 0) | (middle[:, 0] > self.columns)
+        u = np.clip(middle[:, 0], 0, self.columns)
+        v = middle[:, 1]
+        du[outside] = 0.0
+        f = self.values[row, column]
+
+        mass = self.mass[row, column] + f * (u - column)
+        first = self.first[row, column] + f * (u * u + du * du / 12.0 - column * column) / 2.0
+        second = self.second[row, column] + f * (u ** 3 + u * du * du / 4.0 - column ** 3) / 3.0
+        cross = f * du * dv / 12.0
+        integrals = (mass, first, v * mass + cross, second, (v * v + dv * dv / 12.0) * mass + 2.0 * v * cross)
+        m0, mu, mv, muu, mvv = (np.bincount(owner, weights=dv * integral, minlength=len(polygons)) for integral in integrals)
+
+        # back from pixel units, the orientation of the polygon cancels in the ratios
+        sign = np.sign(m0)
+        site = (origin - low) / self.scale
+        area = np.prod(self.scale)
+        mass = np.abs(m0) * area
+        inertia = sign * area * (self.scale[0] ** 2 * (muu - 2 * site[:, 0] * mu + site[:, 0] ** 2 * m0)
+                                 + self.scale[1] ** 2 * (mvv - 2 * site[:, 1] * mv + site[:, 1] ** 2 * m0))
+
+        empty = (counts < 3) | (mass <= 0)
+        safe = np.where(empty, 1.0, m0)
+        centroids = low + self.scale * np.column_stack((mu / safe, mv / safe))
+        if empty.any():
+            centroids[empty] = clipping.polygon_moments(polygons[empty], counts[empty], origin[empty])[0]
+
+        return centroids, np.where(empty, 0.0, mass), np.where(empty, 0.0, np.maximum(inertia, 0.0))
+
+
+def upload(values, bounds):
+    # validate a raster and store its tables, returns the key later requests refer to it by
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2 or not 0 < values.size <= MAX_PIXELS:
+        raise ValueError("density must be a non-empty 2d array")
+    if not np.isfinite(values).all() or (values < 0).any():
+        raise ValueError("density must be finite and non-negative")
+    if not (bounds[0] < bounds[2] and bounds[1] < bounds[3]):
+        raise ValueError("empty boundaries")
+
+    key = cache.key("density", values, bounds, str(values.shape[1]))
+    if store.get(key) is None:
+        store.put(key, {**tables(values), "bounds": np.array(bounds, dtype=float)})
+    return key
+
+
+def lookup(key):
+    # the stored density, None once it was evicted (or never uploaded)
+    entry = store.get(str(key))
+    return None if entry is None else Density(str(key), entry)
+
+
+store = cache.ResultCache(
+    getattr(settings, "ILLOYD_DENSITY_MAX_BYTES", 256 * 1024 * 1024),
+    getattr(settings, "ILLOYD_DENSITY_CACHE_ALIAS", None),
+    getattr(settings, "ILLOYD_DENSITY_CACHE_TIMEOUT", 24 * 3600),
+    name="density",
+)
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from django.conf import settings
+from shapely.errors import ShapelyError
+import threading
+import numpy as np
+import shapely
+import shapely.geometry
+from . import cache
+from . import clipping
+
+MAX_VERTICES = 1 << 20
+PIECE_VERTICES = 64
+MAX_DEPTH = 16
+POLYGON = 3
+
+
+def pieces(geometry):
+    # the domain cut by a quadtree into polygons of at most PIECE_VERTICES vertices, so a cell on its
+    # boundary is intersected with the few small pieces it overlaps instead of the whole boundary
+    done = []
+    pending = np.array([geometry])
+    for depth in range(MAX_DEPTH + 1):
+        parts = shapely.get_parts(pending)
+        parts = parts[(shapely.get_type_id(parts) == POLYGON) & (shapely.area(parts) > 0)]
+        small = shapely.get_num_coordinates(parts) <= PIECE_VERTICES
+        if depth == MAX_DEPTH:
+            small[:] = True
+        done.append(parts[small])
+        pending = parts[~small]
+        if not len(pending):
+            break
+
+        min_x, min_y, max_x, max_y = shapely.bounds(pending).T
+        mid_x, mid_y = (min_x + max_x) / 2.0, (min_y + max_y) / 2.0
+        quadrants = (np.concatenate((min_x, mid_x, min_x, mid_x)), np.concatenate((min_y, min_y, mid_y, mid_y)),
+                     np.concatenate((mid_x, max_x, mid_x, max_x)), np.concatenate((mid_y, mid_y, max_y, max_y)))
+        pending = np.tile(pending, 4)
+        # the rectangle clip is an order of magnitude faster than an intersection but does not promise a
+        # valid result, the few invalid ones are cut again exactly. it takes one rectangle per call
+        clipped = np.array([shapely.clip_by_rect(piece, *bounds) for piece, *bounds in zip(pending, *quadrants)], dtype=object)
+        invalid = ~shapely.is_valid(clipped)
+        if invalid.any():
+            clipped[invalid] = shapely.intersection(pending[invalid], shapely.box(*(bound[invalid] for bound in quadrants)))
+        pending = clipped
+
+    return np.concatenate(done)
+
+
+def ring_moments(polygons, owner, origin, count):
+    # area, first and second moment about its site of every cell from the polygons it was cut into, by
+    # the shoelace formula on coordinates relative to the site. exterior rings count positive and holes
+    # negative whatever their orientation
+    rings, part = shapely.get_rings(polygons, return_index=True)
+    exterior = np.ones(len(part), dtype=bool)
+    exterior[1:] = part[1:] != part[:-1]
+    coordinates, ring = shapely.get_coordinates(rings, return_index=True)
+    local = coordinates - origin[owner[part[ring]]]
+
+    # rings are closed, every coordinate but the last of its ring starts an edge
+    edge = np.flatnonzero(ring[:-1] == ring[1:])
+    a, b, ring = local[edge], local[edge + 1], ring[edge]
+    cross = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+    orientation = np.sign(np.bincount(ring, weights=cross, minlength=len(rings))) * np.where(exterior, 1.0, -1.0)
+    cross = cross * orientation[ring]
+
+    cell = owner[part[ring]]
+    sums = lambda weights: np.bincount(cell, weights=weights, minlength=count)
+    area = sums(cross) / 2.0
+    first = np.column_stack((sums((a[:, 0] + b[:, 0]) * cross), sums((a[:, 1] + b[:, 1]) * cross))) / 6.0
+    inertia = sums(cross * ((a * a).sum(axis=1) + (a * b).sum(axis=1) + (b * b).sum(axis=1))) / 12.0
+    return area, first, inertia
+
+
+class Domain:
+    # a polygonal domain with holes, prepared once: the geometry for containment tests, and its
+    # pieces in an STRtree to find what a cell on the boundary overlaps. as a weight it is the density
+    # that is one inside the polygon and zero outside, so it goes wherever a density.Density does
+    clips = True
+
+    def __init__(self, key, geometry):
+        self.key = key
+        self.geometry = geometry
+        shapely.prepare(self.geometry)
+        self.bounds = tuple(float(value) for value in geometry.bounds)
+        self.pieces = pieces(geometry)
+        self.tree = shapely.STRtree(self.pieces)
+
+    def at(self, points):
+        # one at the points inside the domain, zero outside
+        return shapely.contains_xy(self.geometry, points[:, 0], points[:, 1]).astype(float)
+
+    def moments(self, polygons, counts, origin):
+        # centroid, area and second moment about the site of every polygon intersected with the domain,
+        # same layout as clipping.polygon_moments. cells lying fully inside are exact as they are, the
+        # others are intersected with the pieces they overlap. cells outside the domain have no area and
+        # their site as centroid, so those sites stay where they are
+        centroids, areas, inertia = clipping.polygon_moments(polygons, counts, origin)
+
+        cells = np.full(len(polygons), None, dtype=object)
+        valid = np.flatnonzero(counts >= 3)
+        vertex = np.arange(polygons.shape[1])[None, :] < counts[valid, None]
+        rings = shapely.linearrings(polygons[valid][vertex], indices=np.repeat(np.arange(len(valid)), counts[valid]))
+        cells[valid] = shapely.polygons(rings)
+
+        rest = np.flatnonzero(~shapely.contains(self.geometry, cells))
+        cell, piece = self.tree.query(cells[rest], predicate="intersects")
+        # pieces lying fully inside the cell need no intersection either
+        overlap = self.pieces[piece]
+        cut = ~shapely.within(overlap, cells[rest][cell])
+        overlap[cut] = shapely.intersection(cells[rest][cell[cut]], overlap[cut])
+        parts, part = shapely.get_parts(overlap, return_index=True)
+        polygon = shapely.get_type_id(parts) == POLYGON
+
+        area, first, second = ring_moments(parts[polygon], cell[part[polygon]], origin[rest], len(rest))
+        empty = area <= 0
+        safe = np.where(empty, 1.0, area)
+        centroids[rest] = origin[rest] + np.where(empty[:, None], 0.0, first / safe[:, None])
+        areas[rest] = np.where(empty, 0.0, area)
+        inertia[rest] = np.where(empty, 0.0, np.maximum(second, 0.0))
+
+        return centroids, areas, inertia
+
+
+def parse(geojson):
+    # a GeoJSON Polygon or MultiPolygon, raises ValueError when it is not a valid one
+    try:
+        geometry = shapely.geometry.shape(geojson)
+    except (AttributeError, IndexError, KeyError, TypeError, ShapelyError) as error:
+        raise ValueError("domain must be a GeoJSON polygon") from error
+
+    if geometry.geom_type not in ("Polygon", "MultiPolygon") or geometry.is_empty or geometry.area <= 0:
+        raise ValueError("domain must be a non-empty polygon")
+    if shapely.get_num_coordinates(geometry) > MAX_VERTICES:
+        raise ValueError("domain has too many vertices")
+    if not np.isfinite(shapely.get_coordinates(geometry)).all() or not geometry.is_valid:
+        raise ValueError("domain must be a valid polygon")
+    return geometry
+
+
+def upload(geojson):
+    # validate a domain and store its geometry, returns the key later requests refer to it by
+    geometry = parse(geojson)
+
+    # the ring sizes of every polygon tell holes apart from the next polygon
+    structure = ";".join(",".join(str(len(ring.coords)) for ring in (part.exterior, *part.interiors)) for part in shapely.get_parts(geometry))
+    key = cache.key("domain", shapely.get_coordinates(geometry), geometry.bounds, structure)
+    if store.get(key) is None:
+        store.put(key, {"wkb": np.frombuffer(shapely.to_wkb(geometry), dtype=np.uint8)})
+    return key
+
+
+def lookup(key):
+    # the prepared domain, None once it was evicted (or never uploaded). preparing it again splits the
+    # geometry, so the worker also keeps the last PREPARED domains it used
+    key = str(key)
+    with lock:
+        found = prepared.get(key)
+        if found is not None:
+            prepared.move_to_end(key)
+            return found
+
+    entry = store.get(key)
+    if entry is None:
+        return None
+    found = Domain(key, shapely.from_wkb(entry["wkb"].tobytes()))
+
+    with lock:
+        prepared[key] = found
+        while len(prepared) > PREPARED:
+            prepared.popitem(last=False)
+    return found
+
+
+store = cache.ResultCache(
+    getattr(settings, "ILLOYD_DOMAIN_MAX_BYTES", 64 * 1024 * 1024),
+    getattr(settings, "ILLOYD_DOMAIN_CACHE_ALIAS", None),
+    getattr(settings, "ILLOYD_DOMAIN_CACHE_TIMEOUT", 24 * 3600),
+    name="domain",
+)
+
+PREPARED = getattr(settings, "ILLOYD_DOMAIN_PREPARED", 16)
+prepared = OrderedDict()
+lock = threading.Lock()
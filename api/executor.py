@@ -0,0 +1,328 @@
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial, wraps
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+import asyncio
+import os
+import threading
+import numpy as np
+from . import metrics
+from . import wire
+
+# every input segment starts with a control block, the parent sets its first byte to cancel the job
+CONTROL_BYTES = 8
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+def warm():
+    # worker initializer, numpy, qhull and the geometry modules are loaded and run once before the
+    # first job arrives
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iLloyd.settings")
+    from . import startup
+    startup.exercise()
+
+
+def ready():
+    return os.getpid()
+
+
+def no_checkpoint():
+    pass
+
+
+def export(result):
+    # arrays go back through shared memory segments, the parent unlinks them once copied
+    fields, arrays = {}, {}
+    for name, value in result.items():
+        if not isinstance(value, np.ndarray):
+            fields[name] = value
+            continue
+
+        value = np.ascontiguousarray(value)
+        segment = SharedMemory(create=True, size=max(value.nbytes, 1))
+        np.ndarray(value.shape, value.dtype, segment.buf)[...] = value
+        arrays[name] = (segment.name, value.shape, value.dtype.str)
+        segment.close()
+
+    return fields, arrays
+
+
+def collect(fields, arrays):
+    result = dict(fields)
+    for name, (segment_name, shape, dtype) in arrays.items():
+        segment = SharedMemory(name=segment_name)
+        result[name] = np.ndarray(shape, dtype, segment.buf).copy()
+        segment.close()
+        segment.unlink()
+    return result
+
+
+def discard(future):
+    # outputs of a job nobody waits for any more
+    if not future.cancelled() and future.exception() is None:
+        collect(*future.result())
+
+
+def run_chunk(function, items):
+    return [function(*item) for item in items]
+
+
+def execute(job, segment_name, shape, bounds, options):
+    # runs in the worker: points are read from the shared segment, the job checks the cancel flag
+    # at its checkpoints
+    segment = SharedMemory(name=segment_name)
+    try:
+        points = np.ndarray(shape, np.float64, segment.buf, CONTROL_BYTES).copy()
+
+        def checkpoint():
+            if segment.buf[0]:
+                raise Cancelled()
+
+        checkpoint()
+        return export(job(points, bounds, checkpoint, **options))
+    finally:
+        segment.close()
+
+
+def default_workers():
+    # every process of the server starts its own pool once a view needs it, so the cores are divided
+    # among them. gunicorn.conf.py passes its worker count on as ILLOYD_SERVER_WORKERS
+    server_workers = max(int(os.environ.get("ILLOYD_SERVER_WORKERS", 1)), 1)
+    return max((os.cpu_count() or 1) // server_workers, 1)
+
+
+class GeometryPool:
+    # warm worker processes for the geometry jobs of the async and batch views. async jobs with little
+    # work run on a thread of the event loop instead, so they never queue behind large ones
+    def __init__(self, workers, max_pending, timeout, inline_points):
+        self.workers = workers or default_workers()
+        self.max_pending = max_pending or 4 * self.workers
+        self.timeout = timeout
+        self.inline_points = inline_points
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pending = 0
+
+    def executor(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"), initializer=warm)
+            return self.pool
+
+    def start(self):
+        # workers are spawned on demand, one trivial job per worker brings them all up
+        pool = self.executor()
+        for future in [pool.submit(ready) for _ in range(self.workers)]:
+            future.result()
+
+    def admit(self, count=1):
+        with self.lock:
+            if self.pending + count > self.max_pending:
+                metrics.registry.increment("executor.rejected")
+                raise Overloaded()
+            self.pending += count
+
+    def release(self, count=1):
+        with self.lock:
+            self.pending -= count
+
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    async def run(self, job, points, bounds, cost=None, **options):
+        # run job(points, bounds, checkpoint, **options) and return its result dict. cost is the work
+        # in points times iterations, len(points) by default, and below inline_points the job runs on a
+        # thread here. raises Overloaded when too many jobs are pending and asyncio.TimeoutError when
+        # the job runs past the timeout
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        cost = len(points) if cost is None else cost
+
+        if cost < self.inline_points:
+            metrics.registry.increment("executor.inline")
+            return await self.run_inline(job, points, bounds, options)
+
+        self.admit()
+        future = None
+        segment = SharedMemory(create=True, size=CONTROL_BYTES + points.nbytes)
+        try:
+            segment.buf[:CONTROL_BYTES] = bytes(CONTROL_BYTES)
+            np.ndarray(points.shape, np.float64, segment.buf, CONTROL_BYTES)[...] = points
+
+            try:
+                future = self.executor().submit(execute, job, segment.name, points.shape, bounds, options)
+            except BrokenProcessPool:
+                # a worker died (e.g. killed for memory), the next job starts a fresh pool
+                self.shutdown()
+                raise
+            # the job holds its worker until it reaches a checkpoint, even once nobody waits for it
+            future.add_done_callback(lambda _: self.release())
+
+            try:
+                fields, arrays = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+                # timed out or the client went away: queued jobs are dropped, running ones stop at their
+                # next checkpoint
+                segment.buf[0] = 1
+                future.add_done_callback(discard)
+                metrics.registry.increment("executor.timeouts" if isinstance(error, asyncio.TimeoutError) else "executor.cancelled")
+                raise
+        finally:
+            if future is None:
+                self.release()
+            segment.close()
+            segment.unlink()
+
+        metrics.registry.increment("executor.pooled")
+        return collect(fields, arrays)
+
+    async def run_inline(self, job, points, bounds, options):
+        # same timeout and cancellation as a pooled job, the thread stops at the job's next checkpoint
+        stopped = threading.Event()
+
+        def checkpoint():
+            if stopped.is_set():
+                raise Cancelled()
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(None, partial(job, points, bounds, checkpoint, **options)), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            stopped.set()
+            metrics.registry.increment("executor.timeouts" if isinstance(error, asyncio.TimeoutError) else "executor.cancelled")
+            raise
+
+    def map(self, function, items, costs):
+        # submit function(*item) for every item, in contiguous chunks of about equal cost, two per
+        # worker so a slow chunk does not leave cores idle. returns (future, start, stop) per chunk,
+        # every result of a chunk comes back with it. raises Overloaded when the pool is full
+        if not items:
+            return []
+
+        target = sum(costs) / min(len(items), 2 * self.workers)
+        chunks, start, total = [], 0, 0
+        for index, cost in enumerate(costs):
+            total += cost
+            if total >= target or index == len(items) - 1:
+                chunks.append((start, index + 1))
+                start, total = index + 1, 0
+
+        self.admit(len(chunks))
+        submitted = []
+        try:
+            pool = self.executor()
+            for start, stop in chunks:
+                future = pool.submit(run_chunk, function, items[start:stop])
+                future.add_done_callback(lambda _: self.release())
+                submitted.append((future, start, stop))
+        except BrokenProcessPool:
+            self.release(len(chunks) - len(submitted))
+            self.shutdown()
+            raise
+
+        metrics.registry.increment("executor.chunks", len(chunks))
+        return submitted
+
+    def starmap(self, function, items, costs):
+        # function(*item) for every item, in order, computed by the workers. raises Overloaded, the
+        # error of a failed job, or TimeoutError when the chunks run past the timeout
+        chunks = self.map(function, items, costs)
+        deadline = self.timeout * -(-len(chunks) // self.workers)
+        try:
+            _, waiting = wait([future for future, _, _ in chunks], timeout=deadline, return_when=FIRST_EXCEPTION)
+            for future, _, _ in chunks:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+            if waiting:
+                raise TimeoutError()
+            return [result for future, _, _ in chunks for result in future.result()]
+        finally:
+            for future, _, _ in chunks:
+                future.cancel()
+
+
+pool = GeometryPool(
+    getattr(settings, "ILLOYD_POOL_WORKERS", None),
+    getattr(settings, "ILLOYD_POOL_MAX_PENDING", None),
+    getattr(settings, "ILLOYD_POOL_TIMEOUT", 60),
+    getattr(settings, "ILLOYD_POOL_INLINE_POINTS", 2000),
+)
+
+
+def offloaded(view):
+    # the part of api_view that async views need: POST only, csrf exempt, the body parsed as JSON or
+    # the array format, and pool errors turned into responses
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if request.method != "POST":
+            return wire.respond(request, {"error": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        try:
+            data = wire.parse_request(request)
+        except ParseError as error:
+            return wire.respond(request, {"error": str(error.detail)}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return await view(request, data, *args, **kwargs)
+        except Overloaded:
+            response = wire.respond(request, {"error": "Too many pending jobs."}, status.HTTP_503_SERVICE_UNAVAILABLE)
+            response["Retry-After"] = "1"
+            return response
+        except asyncio.TimeoutError:
+            return wire.respond(request, {"error": "Job timed out."}, status.HTTP_504_GATEWAY_TIMEOUT)
+        except BrokenProcessPool:
+            return wire.respond(request, {"error": "Worker failed."}, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    wrapped.csrf_exempt = True
+    return wrapped
+
+
+def cancel_on_disconnect(application):
+    # django 3.2 keeps running a view after its client went away. once the body has been read, the
+    # next message can only be http.disconnect, so it is awaited alongside the request and cancels it
+    async def wrapped(scope, receive, send):
+        if scope["type"] != "http":
+            return await application(scope, receive, send)
+
+        body_read = asyncio.Event()
+        disconnected = False
+
+        async def receive_body():
+            message = await receive()
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        request = asyncio.ensure_future(application(scope, receive_body, send))
+
+        async def watch():
+            nonlocal disconnected
+            await body_read.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected = True
+            request.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await request
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            watcher.cancel()
+
+    return wrapped
@@ -3,13 +3,22 @@ import heapq
 import itertools
 
 
+# marker left in heap entries whose item was removed, they are skipped lazily when they reach the top
+REMOVED = "Removed"
+
+
 class Point:
-    def __init__(self, x=0.0, y=0.0):
+    __slots__ = ("x", "y", "index")
+
+    def __init__(self, x=0.0, y=0.0, index=-1):
         self.x = x
         self.y = y
+        self.index = index  # position of a site in the input, -1 for vertices and breakpoints
 
 
 class Event:
+    __slots__ = ("x", "point", "arc", "valid")
+
     def __init__(self, x, point, arc):
         self.x = x
         self.point = point
@@ -18,6 +27,8 @@ class Event:
 
 
 class Arc:
+    __slots__ = ("point", "prev", "next", "event", "left_segment", "right_segment", "left", "right", "parent", "priority")
+
     def __init__(self, point, prev=None, next=None):
         self.point = point
         self.prev = prev
@@ -25,13 +36,21 @@ class Arc:
         self.event = None
         self.left_segment = None
         self.right_segment = None
+        # beach line tree links
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.priority = 0.0
 
 
 class Segment:
-    def __init__(self, start_point):
+    __slots__ = ("start", "end", "done", "sites")
+
+    def __init__(self, start_point, sites=(-1, -1)):
         self.start = start_point
         self.end = None
         self.done = False
+        self.sites = sites  # indices of the two sites the edge separates
 
     def finish(self, point):
         if not self.done:
@@ -44,6 +63,11 @@ class PriorityQueue:
         self.heap = []
         self.entry_finder = {}
         self.counter = itertools.count()
+        self.size = 0  # live entries, removed ones may still sit in the heap
+        self.removed = 0
+
+    def __len__(self):
+        return self.size
 
     def push(self, item):
         if item in self.entry_finder:
@@ -52,37 +76,42 @@ class PriorityQueue:
         entry = [item.x, count, item]
         self.entry_finder[item] = entry
         heapq.heappush(self.heap, entry)
+        self.size += 1
 
     def remove_entry(self, item):
         if item in self.entry_finder:
             entry = self.entry_finder.pop(item)
-            entry[-1] = "Removed"
+            entry[-1] = REMOVED
+            self.size -= 1
+            self.removed += 1
 
     def pop(self):
         while self.heap:
             _, _, item = heapq.heappop(self.heap)
-            if item != "Removed":
+            if item is not REMOVED:
                 del self.entry_finder[item]
+                self.size -= 1
                 return item
         raise KeyError("pop from an empty priority queue")
 
     def top(self):
-        while self.heap:
-            _, _, item = heapq.heappop(self.heap)
-            if item != "Removed":
-                del self.entry_finder[item]
-                self.push(item)
+        # drop removed entries sitting on top, then peek without popping the live one
+        heap = self.heap
+        while heap:
+            item = heap[0][-1]
+            if item is not REMOVED:
                 return item
+            heapq.heappop(heap)
         raise KeyError("top from an empty priority queue")
 
     def empty(self):
-        return not any(item != "Removed" for _, _, item in self.heap)
+        return self.size == 0
 
 
 def circle(a, b, c):
     # calc determ to check if bc is a "right turn" from ab
     det = (b.x - a.x) * (c.y - a.y) - (c.x - a.x) * (b.y - a.y)
-    if det > 0: return False, None, None  # right turn, hence, no circle
+    if det >= 0: return False, None, None  # right turn or co-linear, hence, no circle
 
     # algebra to find the circle center (o) and radius
     A, B, C, D = b.x - a.x, b.y - a.y, c.x - a.x, c.y - a.y
@@ -94,7 +123,6 @@ def circle(a, b, c):
     ox, oy = 1.0 * (D*E - B*F) / G, 1.0 * (A*F - C*E) / G
     circle_x = ox + math.sqrt( (a.x - ox)**2 + (a.y - oy)**2 )
 
-    print(ox, oy)
     return True, circle_x, Point(ox, oy)
 
 
@@ -109,7 +137,6 @@ def intersect(point, arc):
 
     if (arc.prev is None or a <= point.y) and (arc.next is None or point.y <= b):
         intersection_x = 1.0 * ((arc.point.x)**2 + (arc.point.y - point.y)**2 - point.x**2) / (2 * arc.point.x - 2 * point.x)
-        print(intersection_x, point.y)
         return True, Point(intersection_x, point.y)
 
     return False, None
@@ -134,12 +161,16 @@ def intersection(p0, p1, sweep_line_x):
         b = -2.0 * (p0.y / z0 - p1.y / z1)
         c = 1.0 * (p0.y**2 + p0.x**2 - sweep_line_x**2) / z0 - 1.0 * (p1.y**2 + p1.x**2 - sweep_line_x**2) / z1
 
-        disc = b**2 - 4*a*c
+        # two parabolas always meet, a negative discriminant is rounding on co-circular sites
+        disc = max(b**2 - 4*a*c, 0.0)
         py = 1.0 * (-b - math.sqrt(disc)) / (2 * a)
 
-    # calculating the x-coordinate of the intersection
+    # calculating the x-coordinate of the intersection. with both sites on the sweep line (a column of
+    # a grid) the arcs are still rays and their breakpoint lies infinitely far left, the callers only
+    # need its y then
+    if p.x == sweep_line_x:
+        return Point(p.x, py)
     px = 1.0 * (p.x**2 + (p.y - py)**2 - sweep_line_x**2) / (2 * p.x - 2 * sweep_line_x)
-    print(px, py)
     return Point(px, py)
 
 
@@ -147,6 +178,7 @@ def check_circle_event(arc, min_x, event_queue_circles):
     # invalidate the current event if it's not at the current sweep line position
     if arc.event and (arc.event.x != min_x):
         arc.event.valid = False
+        event_queue_circles.remove_entry(arc.event)
     arc.event = None
 
     # only arcs with both previous and next neighbors can create circle events
@@ -0,0 +1,88 @@
+from scipy.spatial import cKDTree, Voronoi, QhullError
+import numpy as np
+from . import clipping
+
+
+def ridge_pairs(vor):
+    # the two sites of every ridge, smaller index first
+    return np.sort(np.asarray(vor.ridge_points, dtype=np.intp), axis=1)
+
+
+def neighbors(pairs, n, sites):
+    # sites sharing a ridge with any of the given ones, without the given ones
+    mark = np.zeros(n, dtype=bool)
+    mark[sites] = True
+    found = np.unique(pairs[mark[pairs].any(axis=1)])
+    return found[~mark[found]]
+
+
+def local_cells(sites, owned, ghosts, bounds, tree):
+    # centroids of the cells of the owned sites clipped to the box, from a diagram of them and the
+    # ghosts, and the ridge pairs of the owned sites. a site closer to a point of a cell than its own
+    # site is closer to one of its vertices, so the ghosts grow by the sites the kd-tree of every site
+    # finds there until no cell is cut any more
+    while True:
+        index = np.concatenate((owned, ghosts))
+        try:
+            vor = Voronoi(sites[index])
+        except QhullError:
+            # too few or collinear sites around the owned ones, take every site
+            if len(index) == len(sites):
+                raise
+            ghosts = np.setdiff1d(np.arange(len(sites)), owned)
+            continue
+
+        site_regions = vor.point_region[:len(owned)]
+        regions = np.unique(site_regions)
+        polygons, counts, origin = clipping.closed_cells(vor, bounds, regions)
+        polygons, counts = clipping.clip_to_box(polygons, counts, bounds)
+
+        vertex = np.arange(polygons.shape[1])[None, :] < counts[:, None]
+        corners = polygons[vertex]
+        reach = np.hypot(*(polygons - origin[:, None, :]).transpose(2, 0, 1))[vertex]
+        slack = 1e-9 * (np.abs(corners).max(axis=1) + reach)
+        distance, _ = tree.query(corners)
+        cut = distance < reach - slack
+        if not cut.any():
+            break
+
+        found = tree.query_ball_point(corners[cut], reach[cut] + slack[cut])
+        extra = np.setdiff1d(np.concatenate([np.asarray(sites_found, dtype=np.intp) for sites_found in found]), index)
+        if not len(extra):
+            break
+        ghosts = np.concatenate((ghosts, extra))
+
+    centroids, _, _ = clipping.polygon_moments(polygons, counts, origin)
+    ridge_points = np.asarray(vor.ridge_points)
+    pairs = np.sort(index[ridge_points[(ridge_points < len(owned)).any(axis=1)]], axis=1)
+    return centroids[np.searchsorted(regions, site_regions)], pairs
+
+
+def step(sites, centroids, pairs, bounds, tolerance):
+    # a lloyd step in which sites within tolerance of their centroid stay where they are. a cell only
+    # changes when its site or one of its old or new neighbors moved, so only those are recomputed.
+    # returns the new sites, centroids and ridge pairs, the sites that moved and the recomputed ones
+    n = len(sites)
+    moved = np.flatnonzero(np.hypot(*(centroids - sites).T) > tolerance)
+    if not len(moved):
+        return sites, centroids, pairs, moved, moved
+
+    sites = sites.copy()
+    sites[moved] = centroids[moved]
+    tree = cKDTree(sites, balanced_tree=False, compact_nodes=False)
+
+    owned = np.union1d(moved, neighbors(pairs, n, moved))
+    while True:
+        owned_centroids, owned_pairs = local_cells(sites, owned, neighbors(pairs, n, owned), bounds, tree)
+        # sites that only now border a moved one
+        joined = np.setdiff1d(neighbors(owned_pairs, n, moved), owned)
+        if not len(joined):
+            break
+        owned = np.union1d(owned, joined)
+
+    centroids = centroids.copy()
+    centroids[owned] = owned_centroids
+    mark = np.zeros(n, dtype=bool)
+    mark[owned] = True
+    pairs = np.concatenate((pairs[~mark[pairs].any(axis=1)], np.unique(owned_pairs, axis=0)))
+    return sites, centroids, pairs, moved, owned
@@ -0,0 +1,192 @@
+from scipy.spatial import Voronoi
+import time
+import numpy as np
+from . import clipping
+from . import metrics
+from . import sampling
+
+
+def parse_boundaries(boundaries):
+    # boundaries are sent as the four limits of an axis-aligned box
+    return (float(boundaries["min_x"]), float(boundaries["min_y"]),
+            float(boundaries["max_x"]), float(boundaries["max_y"]))
+
+
+class Lloyd:
+    # plain lloyd, every site moves onto its centroid
+    def step(self, sites, centroids, areas, energy):
+        return centroids
+
+
+class OverRelaxation:
+    # sites overshoot their centroid by a factor 0 < omega < 2. the factor drops back to 1
+    # once a step raised the energy
+    def __init__(self, omega=1.8):
+        self.omega = float(omega)
+        if not 0.0 < self.omega < 2.0:
+            raise ValueError("omega out of range")
+        self.energy = np.inf
+
+    def step(self, sites, centroids, areas, energy):
+        if energy > self.energy:
+            self.omega = 1.0
+        self.energy = energy
+        return sites + self.omega * (centroids - sites)
+
+
+class Anderson:
+    # anderson acceleration of the fixed point iteration sites -> centroids, mixing the last depth
+    # steps. the mix is type I: the secant condition is tested against the site steps in the area
+    # metric, which makes it a descent method on the energy like lbfgs, where the least squares mix of
+    # the residuals is not and kept raising it. the small system is regularised relative to its trace.
+    # a step that raised the energy is undone: the previous sites take a plain lloyd step instead and
+    # only the newest step of the history is kept
+    def __init__(self, depth=5, regularisation=1e-10):
+        self.depth = int(depth)
+        if not 1 <= self.depth <= 50:
+            raise ValueError("depth out of range")
+        self.regularisation = float(regularisation)
+        if not 0.0 <= self.regularisation < 1.0:
+            raise ValueError("regularisation out of range")
+        self.previous = None
+        self.sites = []
+        self.residuals = []
+
+    def step(self, sites, centroids, areas, energy):
+        if self.previous is not None and energy > self.previous[2]:
+            self.sites = self.sites[-1:]
+            self.residuals = self.residuals[-1:]
+            return self.previous[1]
+        self.previous = (sites, centroids, energy)
+
+        position, residual = sites.ravel(), (centroids - sites).ravel()
+        self.sites = (self.sites + [position])[-self.depth - 1:]
+        self.residuals = (self.residuals + [residual])[-self.depth - 1:]
+        if len(self.sites) == 1:
+            return centroids
+
+        site_steps = np.diff(self.sites, axis=0).T
+        residual_steps = np.diff(self.residuals, axis=0).T
+        weights = np.repeat(areas, 2)
+        system = site_steps.T @ (weights[:, None] * residual_steps)
+        system -= self.regularisation * abs(np.trace(system)) * np.eye(len(system))
+        try:
+            gamma = np.linalg.solve(system, site_steps.T @ (weights * residual))
+        except np.linalg.LinAlgError:
+            return centroids
+        return (position + residual - (site_steps + residual_steps) @ gamma).reshape(sites.shape)
+
+
+class LBFGS:
+    # quasi-newton descent on the CVT energy, whose gradient is 2 * area * (site - centroid). the
+    # inverse hessian starts from 1 / (2 * area), for which a step without history is a lloyd step.
+    # a step that raised the energy is undone as with anderson
+    def __init__(self, depth=7):
+        self.depth = int(depth)
+        if not 1 <= self.depth <= 50:
+            raise ValueError("depth out of range")
+        self.previous = None
+        self.pairs = []
+
+    def step(self, sites, centroids, areas, energy):
+        if self.previous is not None and energy > self.previous[2]:
+            self.pairs.clear()
+            return self.previous[1]
+
+        gradient = (2.0 * areas[:, None] * (sites - centroids)).ravel()
+        if self.previous is not None:
+            s = (sites - self.previous[0]).ravel()
+            y = gradient - self.previous[3]
+            # pairs without positive curvature would break the update
+            if s @ y > 1e-12 * np.sqrt((s @ s) * (y @ y)):
+                self.pairs = (self.pairs + [(s, y, 1.0 / (y @ s))])[-self.depth:]
+        self.previous = (sites, centroids, energy, gradient)
+
+        # two loop recursion
+        q = gradient.copy()
+        alphas = []
+        for s, y, rho in reversed(self.pairs):
+            alpha = rho * (s @ q)
+            q -= alpha * y
+            alphas.append(alpha)
+
+        scale = np.repeat(np.divide(0.5, areas, out=np.zeros_like(areas), where=areas > 0), 2)
+        r = scale * q
+        for (s, y, rho), alpha in zip(self.pairs, reversed(alphas)):
+            r += s * (alpha - rho * (y @ r))
+
+        return sites - r.reshape(sites.shape)
+
+
+METHODS = {
+    "lloyd": Lloyd,
+    "overrelaxation": OverRelaxation,
+    "anderson": Anderson,
+    "lbfgs": LBFGS,
+    "sampled": sampling.Sampled,
+    "macqueen": sampling.MacQueen,
+}
+
+
+def accelerator(method="lloyd", **params):
+    # step strategy by name, raises ValueError or TypeError for an unknown method or bad parameters
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method}")
+    return METHODS[method](**params)
+
+
+def iterate(points, bounds, iterations=1, tolerance=0.0, timings=metrics.NULL_TIMINGS, checkpoint=None, acceleration=None, density=None):
+    # yield the diagram, the new sites and the stats of every step, until the iteration budget is
+    # spent or no site is further than tolerance from its centroid. acceleration names the step
+    # strategy and its parameters, e.g. {"method": "anderson", "depth": 5}, plain lloyd by default.
+    # energy is the CVT energy of the diagram the step started from. checkpoint is called between
+    # steps and may raise to abandon the run. the sampled methods yield no diagram. with a
+    # density.Density sites move to the weighted centroids of their cells, with a domain.Domain to the
+    # centroids of their cells clipped to its polygon
+    sites = np.asarray(points, dtype=float)
+    strategy = accelerator(**(acceleration or {}))
+    low, high = np.array(bounds[:2]), np.array(bounds[2:])
+
+    if isinstance(strategy, sampling.Sampled):
+        yield from strategy.iterate(sites, bounds, iterations, tolerance, timings, checkpoint, density)
+        return
+
+    for iteration in range(iterations):
+        if checkpoint is not None:
+            checkpoint()
+        start = time.perf_counter()
+
+        with timings.phase("diagram"):
+            vor = Voronoi(sites)
+        with timings.phase("clip"):
+            centroids, areas, inertia = clipping.cell_moments(vor, bounds, density=density)
+
+        energy = float(inertia.sum())
+        residual = np.hypot(*(centroids - sites).T)
+        new_sites = np.clip(strategy.step(sites, centroids, areas, energy), low, high)
+
+        displacement = np.hypot(*(new_sites - sites).T)
+        sites = new_sites
+
+        yield vor, sites, {
+            "iteration": iteration + 1,
+            "energy": energy,
+            "max_residual": float(residual.max()),
+            "max_displacement": float(displacement.max()),
+            "mean_displacement": float(displacement.mean()),
+            "duration_ms": (time.perf_counter() - start) * 1000.0,
+        }
+
+        if residual.max() <= tolerance:
+            return
+
+
+def relax(points, bounds, iterations=1, tolerance=0.0, timings=metrics.NULL_TIMINGS, checkpoint=None, acceleration=None, density=None):
+    sites = np.asarray(points, dtype=float)
+    stats = []
+
+    for _, sites, stat in iterate(sites, bounds, iterations, tolerance, timings, checkpoint, acceleration, density):
+        stats.append(stat)
+
+    converged = bool(stats) and stats[-1]["max_residual"] <= tolerance
+    return sites, stats, converged
@@ -0,0 +1,185 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.decorators import api_view
+import bisect
+import threading
+import time
+
+# histogram bucket upper bounds in milliseconds
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"))
+
+
+def enabled():
+    return getattr(settings, "ILLOYD_METRICS", False)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        # cumulative buckets, in the same shape prometheus uses
+        buckets, total = {}, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = total
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class Registry:
+    # process wide histograms of phase durations and totals of counters, keyed by endpoint
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, endpoint, timings, status_code):
+        self.increment(f"{endpoint}.requests")
+        self.increment(f"{endpoint}.status.{status_code}")
+        for phase, duration in timings.phases.items():
+            self.observe(f"{endpoint}.{phase}", duration)
+        for counter, value in timings.counters.items():
+            self.increment(f"{endpoint}.{counter}", value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+
+
+class Timings:
+    # phase durations (ms) and event counters of a single request
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={duration:.3f}" for name, duration in self.phases.items())
+
+
+class NullTimings:
+    # stand-in used while instrumentation is disabled
+    phases = {}
+    counters = {}
+
+    def phase(self, name):
+        return NULL_PHASE
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_PHASE = nullcontext()
+NULL_TIMINGS = NullTimings()
+
+
+def serialized(chunks, timings, finished):
+    # a streamed body with the encoding of every chunk timed as the serialize phase, finished runs
+    # once the body was sent or the client went away
+    chunks = iter(chunks)
+    try:
+        while True:
+            with timings.phase("serialize"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        finished()
+
+
+def instrumented(endpoint):
+    # attach a Timings to the request, render the response inside the serialize phase and
+    # report the phases as a Server-Timing header and into the registry
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not enabled():
+                request.timings = NULL_TIMINGS
+                return view(request, *args, **kwargs)
+
+            timings = request.timings = Timings()
+            start = time.perf_counter()
+
+            response = view(request, *args, **kwargs)
+            if getattr(response, "streaming", False):
+                # the body is encoded while the server sends it, the request is recorded once it ends
+                elapsed = (time.perf_counter() - start) * 1000.0
+                response["Server-Timing"] = timings.server_timing()
+
+                def finished():
+                    timings.phases["total"] = elapsed + timings.phases.get("serialize", 0.0)
+                    registry.record(endpoint, timings, response.status_code)
+
+                response.streaming_content = serialized(response.streaming_content, timings, finished)
+                return response
+
+            if hasattr(response, "render") and not response.is_rendered:
+                with timings.phase("serialize"):
+                    response.render()
+
+            timings.phases["total"] = (time.perf_counter() - start) * 1000.0
+            response["Server-Timing"] = timings.server_timing()
+            registry.record(endpoint, timings, response.status_code)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def allowed(request):
+    # the report is for operators: staff users, and clients from the addresses in
+    # ILLOYD_METRICS_ADDRESSES (loopback by default)
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    return request.META.get("REMOTE_ADDR") in getattr(settings, "ILLOYD_METRICS_ADDRESSES", ("127.0.0.1", "::1"))
+
+
+@api_view(["GET", ])
+def report(request):
+    if not allowed(request):
+        return Response({"error": "Forbidden."}, status=status.HTTP_403_FORBIDDEN)
+    return Response(registry.snapshot(), status=status.HTTP_200_OK)
@@ -0,0 +1,116 @@
+from scipy.spatial import cKDTree
+import time
+import numpy as np
+
+SAMPLES_PER_SITE = 16
+CHUNK = 1 << 20
+MAX_SAMPLES = 1 << 30
+
+
+def stratified(bounds, samples, chunk, rng):
+    # jittered grid samples of the box, one per grid cell, yielded in blocks of rows. the rows come in
+    # order, so consecutive queries hit the same part of the tree, and the grid has less variance than
+    # independent uniform samples
+    min_x, min_y, max_x, max_y = bounds
+    aspect = (max_x - min_x) / max(max_y - min_y, 1e-300)
+    columns = max(1, int(round(np.sqrt(samples * aspect))))
+    rows = max(1, -(-samples // columns))
+    width, height = (max_x - min_x) / columns, (max_y - min_y) / rows
+    block = max(1, chunk // columns)
+
+    for first in range(0, rows, block):
+        row, column = np.divmod(np.arange(first * columns, min(first + block, rows) * columns), columns)
+        jitter = rng.random((len(row), 2))
+        yield np.column_stack((min_x + (column + jitter[:, 0]) * width, min_y + (row + jitter[:, 1]) * height))
+
+
+def sample_means(tree, bounds, samples, chunk, rng, density=None):
+    # samples of the box go to their nearest site, in chunks so memory stays bounded. returns the
+    # mean sample of every site, the sample counts and the estimated CVT energy. with a density the
+    # samples are weighted by it and the counts become masses
+    n = tree.n
+    low, high = np.array(bounds[:2]), np.array(bounds[2:])
+    sums = np.zeros((n, 2))
+    counts = np.zeros(n)
+    squared = 0.0
+    total = 0
+
+    for batch in stratified(bounds, samples, chunk, rng):
+        distance, nearest = tree.query(batch, workers=-1)
+        weights = np.ones(len(batch)) if density is None else density.at(batch)
+        counts += np.bincount(nearest, weights=weights, minlength=n)
+        sums[:, 0] += np.bincount(nearest, weights=weights * batch[:, 0], minlength=n)
+        sums[:, 1] += np.bincount(nearest, weights=weights * batch[:, 1], minlength=n)
+        squared += float(weights @ (distance * distance))
+        total += len(batch)
+
+    means = np.divide(sums, counts[:, None], out=np.array(tree.data, dtype=float), where=counts[:, None] > 0)
+    energy = squared / max(total, 1) * float(np.prod(high - low))
+    return means, counts, energy
+
+
+class Sampled:
+    # probabilistic lloyd: sites move to the mean of the samples nearest to them, an approximate
+    # centroid that needs a kd-tree instead of the voronoi diagram. samples defaults to
+    # SAMPLES_PER_SITE per site, chunk bounds how many are held in memory at once
+    def __init__(self, samples=None, chunk=CHUNK, seed=0):
+        self.samples = None if samples is None else int(samples)
+        self.chunk = int(chunk)
+        self.seed = int(seed)
+        if (self.samples is not None and not 1 <= self.samples <= MAX_SAMPLES) or self.chunk < 1:
+            raise ValueError("samples or chunk out of range")
+
+    def update(self, sites, means, counts):
+        return means
+
+    def iterate(self, sites, bounds, iterations, tolerance, timings, checkpoint, density=None):
+        # same protocol as lloyd.iterate, without a diagram. the residual is the distance to the sample
+        # mean, an estimate that carries sampling noise
+        rng = np.random.default_rng(self.seed)
+        samples = self.samples or min(SAMPLES_PER_SITE * len(sites), MAX_SAMPLES)
+
+        for iteration in range(iterations):
+            if checkpoint is not None:
+                checkpoint()
+            start = time.perf_counter()
+
+            with timings.phase("diagram"):
+                # the tree is rebuilt every step, an unbalanced one builds faster and queries as well
+                tree = cKDTree(sites, balanced_tree=False, compact_nodes=False)
+            with timings.phase("sample"):
+                means, counts, energy = sample_means(tree, bounds, samples, self.chunk, rng, density)
+
+            residual = np.hypot(*(means - sites).T)
+            new_sites = self.update(sites, means, counts)
+
+            displacement = np.hypot(*(new_sites - sites).T)
+            sites = new_sites
+
+            yield None, sites, {
+                "iteration": iteration + 1,
+                "energy": energy,
+                "max_residual": float(residual.max()),
+                "max_displacement": float(displacement.max()),
+                "mean_displacement": float(displacement.mean()),
+                "duration_ms": (time.perf_counter() - start) * 1000.0,
+            }
+
+            if residual.max() <= tolerance:
+                return
+
+
+class MacQueen(Sampled):
+    # batched macqueen: every site keeps the running mean of all samples it received so far, so
+    # the sampling noise averages out over the iterations
+    def __init__(self, samples=None, chunk=CHUNK, seed=0):
+        super().__init__(samples, chunk, seed)
+        self.seen = None
+
+    def update(self, sites, means, counts):
+        if self.seen is None:
+            self.seen = np.zeros(len(sites))
+        total = self.seen + counts
+        new_sites = np.divide(self.seen[:, None] * sites + counts[:, None] * means, total[:, None],
+                              out=sites.copy(), where=total[:, None] > 0)
+        self.seen = total
+        return new_sites
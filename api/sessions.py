@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from django.conf import settings
+from scipy.spatial import Voronoi
+import threading
+import time
+import uuid
+import numpy as np
+from . import clipping
+from . import incremental
+
+# rough per-site cost of the qhull structures and the python lists scipy keeps for regions and ridges
+BYTES_PER_SITE = 1024
+
+
+class Session:
+    # a site set with its live incremental triangulation and the current centroid of every site.
+    # incremental steps drop the triangulation and keep only the ridge pairs, it is rebuilt once
+    # sites are added. sessions live in the worker process, so clients must be routed back to the
+    # same worker
+    def __init__(self, points, bounds):
+        self.id = uuid.uuid4().hex
+        self.bounds = bounds
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.rebuild(points)
+
+    def rebuild(self, points):
+        self.sites = np.array(points, dtype=float)
+        self.vor = Voronoi(self.sites, incremental=True)
+        self.centroids, _ = clipping.cell_centroids(self.vor, self.bounds)
+        self.pairs = None
+
+    def nbytes(self):
+        # the store calls this without the session lock while a request may be stepping it, so every
+        # attribute is read once
+        sites, centroids, vor, pairs = self.sites, self.centroids, self.vor, self.pairs
+        size = sites.nbytes + centroids.nbytes
+        if vor is not None:
+            size += vor.vertices.nbytes + BYTES_PER_SITE * len(sites)
+        if pairs is not None:
+            size += pairs.nbytes
+        return size
+
+    def close(self):
+        if self.vor is not None:
+            self.vor.close()
+
+    def add(self, points):
+        # qhull inserts the new sites into the existing triangulation, only the cells of the new
+        # sites and of their neighbours are clipped again
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        start = len(self.sites)
+
+        if self.vor is None:
+            self.rebuild(self.sites)
+        self.pairs = None
+        self.vor.add_points(points)
+        self.sites = np.concatenate((self.sites, points))
+
+        added = np.arange(start, len(self.sites))
+        ridges = self.vor.ridge_points
+        touched = ridges[(ridges >= start).any(axis=1)].ravel()
+        affected = np.union1d(touched, added)
+
+        centroids, _ = clipping.cell_centroids(self.vor, self.bounds, affected)
+        self.centroids = np.concatenate((self.centroids, np.empty((len(points), 2))))
+        self.centroids[affected] = centroids
+        return affected
+
+    def remove(self, indices):
+        # qhull cannot delete sites, so the triangulation is rebuilt from the remaining ones
+        indices = np.unique(np.asarray(indices, dtype=np.intp))
+        keep = np.ones(len(self.sites), dtype=bool)
+        keep[indices] = False
+
+        previous = self.centroids[keep]
+        self.close()
+        self.rebuild(self.sites[keep])
+        return indices, np.flatnonzero((self.centroids != previous).any(axis=1))
+
+    def step(self, iterations):
+        # lloyd steps move every site, so each one starts a new triangulation
+        previous = self.sites
+        for _ in range(iterations):
+            self.close()
+            self.rebuild(self.centroids)
+        return np.flatnonzero((self.sites != previous).any(axis=1))
+
+    def step_incremental(self, iterations, tolerance):
+        # lloyd steps in which the sites within tolerance of their centroid stay frozen, only the cells
+        # around the moving ones are recomputed (see incremental.step). returns the sites whose position
+        # or centroid changed and how many sites the last step moved, none once every site is frozen
+        if self.pairs is None:
+            self.pairs = incremental.ridge_pairs(self.vor)
+        self.close()
+        self.vor = None
+
+        previous_sites, previous_centroids = self.sites, self.centroids
+        moved = np.empty(0, dtype=np.intp)
+        for _ in range(iterations):
+            self.sites, self.centroids, self.pairs, moved, _ = incremental.step(self.sites, self.centroids, self.pairs, self.bounds, tolerance)
+            if not len(moved):
+                break
+
+        changed = (self.sites != previous_sites) | (self.centroids != previous_centroids)
+        return np.flatnonzero(changed.any(axis=1)), len(moved)
+
+
+class SessionStore:
+    # sessions by id in least recently used order, bounded by total size and idle time
+    def __init__(self, max_bytes, idle_seconds):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+
+    def add(self, session):
+        with self.lock:
+            self.sessions[session.id] = session
+            self.evict()
+
+    def get(self, session_id):
+        with self.lock:
+            self.evict()
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def touched(self):
+        # a session grew, re-check the memory cap
+        with self.lock:
+            self.evict()
+
+    def evict(self):
+        deadline = time.monotonic() - self.idle_seconds
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            total = sum(s.nbytes() for s in self.sessions.values())
+            if session.last_used >= deadline and (total <= self.max_bytes or len(self.sessions) == 1):
+                break
+            # the qhull instance is freed with the session, closing it here could race a request still using it
+            del self.sessions[session_id]
+
+
+store = SessionStore(
+    getattr(settings, "ILLOYD_SESSION_MAX_BYTES", 256 * 1024 * 1024),
+    getattr(settings, "ILLOYD_SESSION_IDLE_SECONDS", 600),
+)
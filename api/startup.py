@@ -0,0 +1,53 @@
+from django.urls import get_resolver
+import logging
+import time
+import numpy as np
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_SITES = 64
+
+# what starting this process cost in ms: importing the views with the geometry modules, and the warm-up
+durations = {}
+
+
+def exercise(sites=WARM_UP_SITES):
+    # every geometry path once on a small input, so qhull, the kd-tree, the sweep and the encoders
+    # have done their lazy loading and first call setup before a request needs them. the views are
+    # imported here, so that load() still measures them
+    from . import lloyd, tiles, voronoi, wire
+
+    points = np.random.default_rng(0).random((sites, 2))
+    bounds = (0.0, 0.0, 1.0, 1.0)
+
+    for job in (voronoi.delaunay_job, voronoi.fortune_job, voronoi.relax_job):
+        result = job(points, bounds, voronoi.executor.no_checkpoint)
+        wire.encode(result)
+        "".join(wire.json_chunks(result))
+
+    tiles.tiled_diagram(points, bounds, 4)
+    lloyd.relax(points, bounds, acceleration={"method": "sampled"})
+
+
+def load():
+    # import the url configuration, which django otherwise leaves to the first request
+    if "imports" not in durations:
+        start = time.perf_counter()
+        get_resolver().url_patterns
+        durations["imports"] = (time.perf_counter() - start) * 1000.0
+        metrics.registry.observe("startup.imports", durations["imports"])
+    return durations
+
+
+def warm_up():
+    # load and exercise the service once per process, a forked worker inherits what its parent did.
+    # returns the durations, they are also reported as the startup histograms of api/metrics/
+    load()
+    if "warmup" not in durations:
+        start = time.perf_counter()
+        exercise()
+        durations["warmup"] = (time.perf_counter() - start) * 1000.0
+        metrics.registry.observe("startup.warmup", durations["warmup"])
+        logger.info("geometry service warm: imports %.1f ms, warm-up %.1f ms", durations["imports"], durations["warmup"])
+    return durations
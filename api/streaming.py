@@ -0,0 +1,30 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+import json
+
+
+def event(name, payload):
+    # one server-sent event, numpy arrays in the payload are written as nested lists
+    return f"event: {name}\ndata: {json.dumps(payload, cls=JSONEncoder)}\n\n"
+
+
+def event_stream(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # keep reverse proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class EventStreamRenderer(BaseRenderer):
+    # lets content negotiation accept clients asking for text/event-stream. the stream itself is a
+    # StreamingHttpResponse, only the error responses before it starts are rendered, as an error event
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return event("error", data).encode("utf-8")
@@ -0,0 +1,35 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+import numpy as np
+from api import executor
+from api import voronoi
+
+BOUNDARIES = {"min_x": 0, "min_y": 0, "max_x": 1, "max_y": 1}
+
+
+class BatchTest(SimpleTestCase):
+    def job(self, algorithm, points):
+        return {"algorithm": algorithm, "points": points, "boundaries": BOUNDARIES}
+
+    def test_bad_jobs_only_fail_themselves(self):
+        points = np.random.default_rng(0).random((20, 2)).tolist()
+        jobs = [self.job("fortune", points), self.job("fortune", []), self.job("delaunay", points[:2]), self.job("relax", points)]
+        response = self.client.post("/api/batch/", json.dumps({"jobs": jobs}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        results = response.json()["results"]
+        self.assertEqual(len(results[0]["centroids"]), 20)
+        self.assertEqual(results[1], {"error": "Invalid job."})
+        self.assertEqual(results[2], {"error": "Invalid job."})
+        self.assertEqual(len(results[3]["points"]), 20)
+
+    def test_a_crash_only_marks_its_own_job(self):
+        # a chunk runs its jobs one after the other in a worker, a crash must not take the others along
+        points = np.random.default_rng(1).random((20, 2))
+        items = [voronoi.batch_entry(self.job("delaunay", points.tolist())), voronoi.batch_entry(self.job("fortune", points.tolist()))]
+        with mock.patch.object(voronoi, "fortune_diagram", side_effect=AttributeError("next")), self.assertLogs(voronoi.logger, "ERROR"):
+            results = executor.run_chunk(voronoi.batch_job, items)
+
+        self.assertEqual(len(results[0]["centroids"]), 20)
+        self.assertEqual(results[1], {"error": "Job failed."})
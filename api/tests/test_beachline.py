@@ -0,0 +1,23 @@
+from unittest import mock
+from django.test import SimpleTestCase
+import numpy as np
+from api import helper
+from api import voronoi
+
+
+def breakpoint_evaluations(n):
+    # parabola breakpoints the sweep evaluates on n uniform sites, each locate step costs one or two
+    points = np.random.default_rng(n).random((n, 2))
+    with mock.patch.object(helper, "intersection", wraps=helper.intersection) as intersection:
+        voronoi.fortune_sweep(points, (0.0, 0.0, 1.0, 1.0))
+    return intersection.call_count
+
+
+class BeachLineScalingTest(SimpleTestCase):
+    def test_locating_arcs_scales_n_log_n(self):
+        # with a linear walk over the beach line the evaluations per site grow like n, with the treap
+        # like log n: eight times the sites may cost a bit more per site, not eight times as much
+        small, large = 1000, 8000
+        per_site_small = breakpoint_evaluations(small) / small
+        per_site_large = breakpoint_evaluations(large) / large
+        self.assertLess(per_site_large / per_site_small, 2.0 * np.log(large) / np.log(small))
@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+from shapely.geometry import Polygon, box
+import numpy as np
+from api import clipping
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class CellCentroidsTest(SimpleTestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).random((500, 2))
+        self.vor = Voronoi(self.points)
+
+    def test_closed_cells_match_shapely(self):
+        # the per-cell path it replaced: the polygon of every closed region intersected with the box
+        centroids, areas = clipping.cell_centroids(self.vor, BOUNDS)
+        boundary = box(*BOUNDS)
+
+        checked = 0
+        for site, region in enumerate(self.vor.point_region):
+            vertices = self.vor.regions[region]
+            if -1 in vertices:
+                continue
+            clipped = Polygon(self.vor.vertices[vertices]).intersection(boundary)
+            if clipped.is_empty:
+                continue
+            np.testing.assert_allclose(centroids[site], clipped.centroid.coords[0], atol=1e-12)
+            self.assertAlmostEqual(areas[site], clipped.area, places=12)
+            checked += 1
+        self.assertGreater(checked, 400)
+
+    def test_cells_cover_the_box(self):
+        # open cells are closed against the box too, so every site gets a cell and they tile the box
+        centroids, areas = clipping.cell_centroids(self.vor, BOUNDS)
+        self.assertEqual(len(centroids), len(self.points))
+        self.assertAlmostEqual(areas.sum(), 1.0, places=12)
+        self.assertTrue(((centroids >= 0.0) & (centroids <= 1.0)).all())
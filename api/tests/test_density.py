@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+from shapely.geometry import Polygon, box
+import numpy as np
+from api import clipping
+from api import density
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+def piece_moments(piece, site):
+    # unweighted centroid, area and second moment about the site of a shapely polygon
+    coordinates = np.asarray(piece.exterior.coords)[:-1]
+    centroids, areas, inertia = clipping.polygon_moments(coordinates[None], np.array([len(coordinates)]), site[None])
+    return centroids[0], areas[0], inertia[0]
+
+
+class DensityMomentsTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        values = rng.random((12, 16))
+        values[:4, :5] = 0.0
+        self.density = density.Density("test", {**density.tables(values), "bounds": np.array(BOUNDS)})
+        self.points = rng.random((200, 2))
+        self.vor = Voronoi(self.points)
+
+    def test_closed_cells_match_pixel_intersections(self):
+        # the density is constant on every pixel, so each cell is exactly the sum of its pieces in them
+        centroids, masses, inertia = clipping.cell_moments(self.vor, BOUNDS, density=self.density)
+        width, height = 1.0 / 16, 1.0 / 12
+        boundary = box(*BOUNDS)
+
+        checked = 0
+        for site, region in enumerate(self.vor.point_region):
+            vertices = self.vor.regions[region]
+            if -1 in vertices:
+                continue
+            cell = Polygon(self.vor.vertices[vertices]).intersection(boundary)
+            mass, moment, second = 0.0, np.zeros(2), 0.0
+            for row, column in zip(*np.nonzero(self.density.values)):
+                piece = cell.intersection(box(column * width, row * height, (column + 1) * width, (row + 1) * height))
+                if piece.is_empty or piece.geom_type != "Polygon":
+                    continue
+                centroid, area, piece_second = piece_moments(piece, self.points[site])
+                value = self.density.values[row, column]
+                mass += value * area
+                moment += value * area * centroid
+                second += value * piece_second
+            if mass <= 0:
+                continue
+
+            self.assertAlmostEqual(masses[site], mass, places=12)
+            np.testing.assert_allclose(centroids[site], moment / mass, atol=1e-10)
+            self.assertAlmostEqual(inertia[site], second, places=12)
+            checked += 1
+        self.assertGreater(checked, 100)
+
+    def test_uniform_density_matches_areas(self):
+        uniform = density.Density("uniform", {**density.tables(np.full((7, 9), 2.0)), "bounds": np.array(BOUNDS)})
+        centroids, masses, inertia = clipping.cell_moments(self.vor, BOUNDS, density=uniform)
+        expected, areas, second = clipping.cell_moments(self.vor, BOUNDS)
+        np.testing.assert_allclose(centroids, expected, atol=1e-10)
+        np.testing.assert_allclose(masses, 2.0 * areas, atol=1e-12)
+        np.testing.assert_allclose(inertia, 2.0 * second, atol=1e-12)
+
+    def test_empty_cells_keep_their_centroid(self):
+        # sites whose cells lie in the zero block have no mass and fall back to the plain centroid
+        centroids, masses, _ = clipping.cell_moments(self.vor, BOUNDS, density=self.density)
+        expected, _ = clipping.cell_centroids(self.vor, BOUNDS)
+        empty = masses == 0
+        self.assertTrue(empty.any())
+        np.testing.assert_allclose(centroids[empty], expected[empty], atol=1e-12)
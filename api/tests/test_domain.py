@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+from shapely.geometry import Point, Polygon, box
+import numpy as np
+from api import clipping
+from api import domain
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class DomainMomentsTest(SimpleTestCase):
+    def setUp(self):
+        # a disk with a square hole, its boundary has far more vertices than a piece holds
+        self.geometry = Point(0.5, 0.5).buffer(0.45, 256).difference(box(0.4, 0.3, 0.6, 0.5))
+        self.domain = domain.Domain("test", self.geometry)
+        self.points = np.random.default_rng(0).random((500, 2))
+        self.vor = Voronoi(self.points)
+
+    def test_pieces_cover_the_domain(self):
+        self.assertGreater(len(self.domain.pieces), 1)
+        self.assertAlmostEqual(sum(piece.area for piece in self.domain.pieces), self.geometry.area, places=12)
+
+    def test_closed_cells_match_shapely(self):
+        # the per-cell path: the polygon of every closed region intersected with the domain
+        centroids, areas, _ = clipping.cell_moments(self.vor, BOUNDS, density=self.domain)
+
+        checked = cut = 0
+        for site, region in enumerate(self.vor.point_region):
+            vertices = self.vor.regions[region]
+            if -1 in vertices:
+                continue
+            cell = Polygon(self.vor.vertices[vertices])
+            clipped = cell.intersection(self.geometry)
+            if clipped.is_empty:
+                self.assertEqual(areas[site], 0.0)
+                np.testing.assert_array_equal(centroids[site], self.points[site])
+                continue
+            self.assertAlmostEqual(areas[site], clipped.area, places=12)
+            np.testing.assert_allclose(centroids[site], clipped.centroid.coords[0], atol=1e-12)
+            checked += 1
+            cut += not self.geometry.contains(cell)
+        self.assertGreater(checked, 300)
+        self.assertGreater(cut, 50)
+
+    def test_cells_inside_keep_their_moments(self):
+        centroids, areas, inertia = clipping.cell_moments(self.vor, BOUNDS, density=self.domain)
+        expected = clipping.cell_moments(self.vor, BOUNDS)
+        inside = np.array([self.geometry.contains(Polygon(self.vor.vertices[self.vor.regions[region]]))
+                           if -1 not in self.vor.regions[region] else False for region in self.vor.point_region])
+        self.assertTrue(inside.any())
+        for found, reference in zip((centroids, areas, inertia), expected):
+            np.testing.assert_allclose(found[inside], reference[inside], atol=1e-14)
@@ -0,0 +1,83 @@
+from django.test import SimpleTestCase
+import asyncio
+import time
+import numpy as np
+from api import executor
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+def busy_job(points, bounds, checkpoint, seconds=5.0):
+    # works until its checkpoint stops it or the time is up
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        checkpoint()
+        time.sleep(0.01)
+    return {"points": points}
+
+
+def stubborn_job(points, bounds, checkpoint, seconds=1.0):
+    # never reaches a checkpoint
+    time.sleep(seconds)
+    return {"points": points}
+
+
+class InlineTest(SimpleTestCase):
+    def test_small_job_runs_inline(self):
+        pool = executor.GeometryPool(1, 1, 5, 100)
+        points = np.random.default_rng(0).random((10, 2))
+        result = asyncio.run(pool.run(busy_job, points, BOUNDS, seconds=0.0))
+        np.testing.assert_array_equal(result["points"], points)
+        self.assertIsNone(pool.pool)
+
+    def test_inline_job_times_out_and_stops(self):
+        pool = executor.GeometryPool(1, 1, 0.1, 100)
+        stopped = []
+
+        def job(points, bounds, checkpoint):
+            try:
+                busy_job(points, bounds, checkpoint)
+            except executor.Cancelled:
+                stopped.append(True)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(pool.run(job, np.zeros((10, 2)), BOUNDS))
+        # asyncio.run waits for the default executor's threads, the job saw its checkpoint fail
+        self.assertEqual(stopped, [True])
+
+    def test_costly_job_is_not_inlined(self):
+        # few points but many iterations goes to the pool, here one that is already full
+        pool = executor.GeometryPool(1, 1, 5, 100)
+        pool.pending = 1
+        with self.assertRaises(executor.Overloaded):
+            asyncio.run(pool.run(busy_job, np.zeros((10, 2)), BOUNDS, 10 * 1000))
+
+
+class PooledTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pool = executor.GeometryPool(1, 1, 0.2, 0)
+        cls.pool.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        super().tearDownClass()
+
+    def test_pending_until_the_worker_is_free(self):
+        # a job that timed out still holds its worker until it returns, it stays counted till then
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.pool.run(stubborn_job, np.zeros((10, 2)), BOUNDS))
+        self.assertEqual(self.pool.pending, 1)
+        with self.assertRaises(executor.Overloaded):
+            asyncio.run(self.pool.run(stubborn_job, np.zeros((10, 2)), BOUNDS))
+
+        deadline = time.monotonic() + 10
+        while self.pool.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.pool.pending, 0)
+
+        points = np.random.default_rng(0).random((10, 2))
+        result = asyncio.run(self.pool.run(busy_job, points, BOUNDS, seconds=0.0))
+        np.testing.assert_array_equal(result["points"], points)
@@ -0,0 +1,45 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+import warnings
+import numpy as np
+from api import clipping
+from api import voronoi
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class FortuneDiagramTest(SimpleTestCase):
+    def test_centroids_match_qhull(self):
+        points = np.random.default_rng(1).random((500, 2))
+        _, centroids, _ = voronoi.fortune_diagram(points, BOUNDS)
+        expected, _ = clipping.cell_centroids(Voronoi(points), BOUNDS)
+        np.testing.assert_allclose(centroids, expected, atol=1e-9)
+
+    def test_duplicates_share_their_centroid(self):
+        points = np.random.default_rng(2).random((200, 2))
+        points = np.concatenate((points, points[:10]))
+        _, centroids, _ = voronoi.fortune_diagram(points, BOUNDS)
+        expected, _ = clipping.cell_centroids(Voronoi(points[:200]), BOUNDS)
+        np.testing.assert_allclose(centroids[:200], expected, atol=1e-9)
+        np.testing.assert_array_equal(centroids[200:], centroids[:10])
+
+    def test_without_cells_only_edges(self):
+        points = np.random.default_rng(3).random((100, 2))
+        edges, centroids, _ = voronoi.fortune_diagram(points, BOUNDS, cells=False)
+        self.assertIsNone(centroids)
+        self.assertEqual(edges.shape[1], 4)
+
+    def test_grid_and_cocircular_sites(self):
+        # columns of a grid put several sites on the sweep line at once and their triples are co-linear,
+        # sites on a circle are co-circular. neither may divide by zero or leave a nan behind
+        grid = (np.stack(np.meshgrid(np.arange(10), np.arange(10)), axis=-1).reshape(-1, 2) + 0.5) / 10
+        angles = np.linspace(0.0, 2.0 * np.pi, 40, endpoint=False)
+        ring = np.concatenate((0.5 + 0.3 * np.column_stack((np.cos(angles), np.sin(angles))), [[0.5, 0.5]]))
+
+        for points in (grid, grid * [1.0, 0.5] + [0.0, 0.25], ring):
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                edges, centroids, _ = voronoi.fortune_diagram(points, BOUNDS)
+            self.assertTrue(np.isfinite(edges).all())
+            expected, _ = clipping.cell_centroids(Voronoi(points), BOUNDS)
+            np.testing.assert_allclose(centroids, expected, atol=1e-9)
@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+import numpy as np
+from api import clipping
+from api import incremental
+from api import lloyd
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class IncrementalStepTest(SimpleTestCase):
+    def test_matches_a_full_diagram_every_step(self):
+        # with a tolerance only some sites move, the cells recomputed around them must still agree
+        # with a diagram of every site, and so must the ridge pairs carried to the next step
+        sites, _, _ = lloyd.relax(np.random.default_rng(0).random((1000, 2)), BOUNDS, 10)
+        vor = Voronoi(sites)
+        centroids, _ = clipping.cell_centroids(vor, BOUNDS)
+        pairs = incremental.ridge_pairs(vor)
+
+        for tolerance in (2e-3, 1e-3, 1e-3):
+            previous = sites
+            sites, centroids, pairs, moved, owned = incremental.step(sites, centroids, pairs, BOUNDS, tolerance)
+            self.assertTrue(0 < len(moved) < len(sites))
+            self.assertLess(len(owned), len(sites))
+            frozen = np.setdiff1d(np.arange(len(sites)), moved)
+            np.testing.assert_array_equal(sites[frozen], previous[frozen])
+
+            vor = Voronoi(sites)
+            expected, _ = clipping.cell_centroids(vor, BOUNDS)
+            np.testing.assert_allclose(centroids, expected, atol=1e-12)
+            self.assertEqual(set(map(tuple, pairs)), set(map(tuple, incremental.ridge_pairs(vor))))
+
+    def test_converged_sites_do_not_move(self):
+        sites = np.random.default_rng(1).random((100, 2))
+        vor = Voronoi(sites)
+        centroids, _ = clipping.cell_centroids(vor, BOUNDS)
+        pairs = incremental.ridge_pairs(vor)
+        result = incremental.step(sites, centroids, pairs, BOUNDS, 1.0)
+        self.assertIs(result[0], sites)
+        self.assertEqual(len(result[3]), 0)
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+import numpy as np
+from api import lloyd
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class AndersonTest(SimpleTestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).random((200, 2))
+
+    def relax(self, method):
+        return lloyd.relax(self.points, BOUNDS, iterations=300, tolerance=5e-4, acceleration={"method": method})
+
+    def test_fewer_iterations_than_lloyd(self):
+        # every iteration rebuilds the diagram, fewer of them to the same tolerance is the whole point
+        _, plain, plain_converged = self.relax("lloyd")
+        _, accelerated, accelerated_converged = self.relax("anderson")
+        self.assertTrue(plain_converged)
+        self.assertTrue(accelerated_converged)
+        self.assertLess(len(accelerated), 0.75 * len(plain))
+
+    def test_reaches_a_lower_energy(self):
+        _, plain, _ = self.relax("lloyd")
+        _, accelerated, _ = self.relax("anderson")
+        self.assertLessEqual(accelerated[-1]["energy"], plain[-1]["energy"] * (1.0 + 1e-3))
+
+    def test_rejected_step_keeps_newest_history(self):
+        strategy = lloyd.Anderson(depth=3)
+        sites = self.points
+        for energy in (3.0, 2.0, 1.0):
+            centroids = sites + 0.01
+            sites = strategy.step(sites, centroids, np.ones(len(sites)), energy)
+        self.assertEqual(len(strategy.sites), 3)
+
+        previous = strategy.previous[1]
+        returned = strategy.step(sites, sites + 0.01, np.ones(len(sites)), 5.0)
+        np.testing.assert_array_equal(returned, previous)
+        self.assertEqual(len(strategy.sites), 1)
@@ -0,0 +1,31 @@
+import json
+from django.test import SimpleTestCase, override_settings
+import numpy as np
+from api import metrics
+
+BOUNDARIES = {"min_x": 0, "min_y": 0, "max_x": 1, "max_y": 1}
+
+
+class MetricsReportTest(SimpleTestCase):
+    def test_loopback_clients_read_the_report(self):
+        response = self.client.get("/api/metrics/", REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("histograms", response.json())
+
+    def test_other_clients_are_refused(self):
+        self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="203.0.113.7").status_code, 403)
+        with override_settings(ILLOYD_METRICS_ADDRESSES=[]):
+            self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="127.0.0.1").status_code, 403)
+
+    @override_settings(ILLOYD_METRICS=True)
+    def test_streamed_relaxations_are_recorded(self):
+        metrics.registry.reset()
+        points = np.random.default_rng(0).random((30, 2)).tolist()
+        response = self.client.post("/api/relax/stream/", json.dumps({"points": points, "boundaries": BOUNDARIES, "iterations": 2}),
+                                    content_type="application/json", HTTP_ACCEPT="text/event-stream")
+        b"".join(response.streaming_content)
+
+        snapshot = metrics.registry.snapshot()
+        self.assertEqual(snapshot["counters"]["relax_stream.requests"], 1)
+        self.assertEqual(snapshot["histograms"]["relax_stream.total"]["count"], 1)
+        self.assertIn("relax_stream.diagram", snapshot["histograms"])
@@ -0,0 +1,37 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+import numpy as np
+from api import cache
+from api import voronoi
+
+BOUNDARIES = {"min_x": 0, "min_y": 0, "max_x": 1, "max_y": 1}
+
+
+class OutputFieldsTest(SimpleTestCase):
+    def setUp(self):
+        cache.results.clear()
+        self.points = np.random.default_rng(0).random((100, 2)).tolist()
+
+    def post(self, algorithm, fields):
+        body = {"points": self.points, "boundaries": BOUNDARIES, "fields": fields}
+        return self.client.post(f"/api/{algorithm}/", json.dumps(body), content_type="application/json")
+
+    def test_points_only_computes_no_diagram(self):
+        with mock.patch.object(voronoi, "fortune_diagram") as sweep, mock.patch.object(voronoi, "Voronoi") as qhull:
+            for algorithm in ("fortune", "delaunay"):
+                response = self.post(algorithm, ["points"])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.json()), ["points"])
+        sweep.assert_not_called()
+        qhull.assert_not_called()
+
+    def test_fortune_closes_cells_only_for_centroids(self):
+        with mock.patch.object(voronoi, "fortune_diagram", wraps=voronoi.fortune_diagram) as sweep:
+            self.assertEqual(list(self.post("fortune", ["edges"]).json()), ["edges"])
+            self.assertFalse(sweep.call_args.kwargs["cells"])
+            self.assertEqual(len(self.post("fortune", ["centroids"]).json()["centroids"]), 100)
+            self.assertTrue(sweep.call_args.kwargs["cells"])
+            # both are cached now
+            self.post("fortune", ["edges", "centroids"])
+        self.assertEqual(sweep.call_count, 2)
@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+from scipy.spatial import cKDTree, Voronoi
+import numpy as np
+from api import clipping
+from api import sampling
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+class SampleMeansTest(SimpleTestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).random((200, 2))
+        self.tree = cKDTree(self.points)
+        self.samples = 1000 * len(self.points)
+
+    def test_converges_to_the_exact_moments(self):
+        # the mean of the samples nearest a site estimates its centroid, their share its area
+        means, counts, energy = sampling.sample_means(self.tree, BOUNDS, self.samples, sampling.CHUNK, np.random.default_rng(0))
+        centroids, areas, inertia = clipping.cell_moments(Voronoi(self.points), BOUNDS)
+        np.testing.assert_allclose(means, centroids, atol=2e-3)
+        np.testing.assert_allclose(counts / counts.sum(), areas, atol=3e-4)
+        self.assertAlmostEqual(energy / inertia.sum(), 1.0, delta=1e-3)
+
+    def test_chunks_do_not_change_the_result(self):
+        whole = sampling.sample_means(self.tree, BOUNDS, self.samples, sampling.CHUNK, np.random.default_rng(0))
+        chunked = sampling.sample_means(self.tree, BOUNDS, self.samples, 1000, np.random.default_rng(0))
+        np.testing.assert_allclose(chunked[0], whole[0], atol=1e-12)
+        np.testing.assert_array_equal(chunked[1], whole[1])
+        self.assertAlmostEqual(chunked[2], whole[2], places=15)
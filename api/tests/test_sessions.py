@@ -0,0 +1,99 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+import numpy as np
+from api import clipping
+from api import sessions
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+def centroids(points):
+    return clipping.cell_centroids(Voronoi(points), BOUNDS)[0]
+
+
+class SessionTest(SimpleTestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).random((300, 2))
+        self.session = sessions.Session(self.points, BOUNDS)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_add_matches_a_new_diagram(self):
+        # only the cells around the new sites are clipped again, the rest must still hold
+        added = np.random.default_rng(1).random((20, 2))
+        affected = self.session.add(added)
+        points = np.concatenate((self.points, added))
+        np.testing.assert_allclose(self.session.centroids, centroids(points), atol=1e-12)
+        self.assertTrue(set(range(300, 320)) <= set(affected))
+        self.assertLess(len(affected), len(points))
+
+    def test_remove_matches_a_new_diagram(self):
+        removed, _ = self.session.remove([3, 7, 7, 100])
+        np.testing.assert_array_equal(removed, [3, 7, 100])
+        np.testing.assert_allclose(self.session.centroids, centroids(np.delete(self.points, [3, 7, 100], axis=0)), atol=1e-12)
+
+    def test_step_is_a_lloyd_step(self):
+        expected = centroids(self.points)
+        self.session.step(1)
+        np.testing.assert_allclose(self.session.sites, expected, atol=1e-12)
+        np.testing.assert_allclose(self.session.centroids, centroids(expected), atol=1e-12)
+
+    def test_step_incremental_without_tolerance_is_a_lloyd_step(self):
+        self.session.step_incremental(1, 0.0)
+        reference = sessions.Session(self.points, BOUNDS)
+        reference.step(1)
+        np.testing.assert_allclose(self.session.sites, reference.sites, atol=1e-12)
+        np.testing.assert_allclose(self.session.centroids, reference.centroids, atol=1e-9)
+        reference.close()
+
+    def test_add_after_step_incremental(self):
+        # the incremental steps dropped the triangulation, adding sites rebuilds it
+        self.session.step_incremental(2, 1e-3)
+        self.assertIsNone(self.session.vor)
+        sites = self.session.sites.copy()
+        self.session.add([[0.5, 0.5]])
+        np.testing.assert_allclose(self.session.centroids, centroids(np.concatenate((sites, [[0.5, 0.5]]))), atol=1e-12)
+
+    def test_nbytes_without_triangulation(self):
+        before = self.session.nbytes()
+        self.session.step_incremental(1, 0.0)
+        self.assertGreater(self.session.nbytes(), 0)
+        self.assertLess(self.session.nbytes(), before)
+
+
+class SessionStoreTest(SimpleTestCase):
+    def session(self):
+        return sessions.Session(np.random.default_rng(0).random((50, 2)), BOUNDS)
+
+    def test_evicts_least_recently_used_over_the_cap(self):
+        first, second, third = self.session(), self.session(), self.session()
+        store = sessions.SessionStore(2 * first.nbytes(), 600)
+        store.add(first)
+        store.add(second)
+        store.get(first.id)
+        store.add(third)
+        self.assertIsNone(store.get(second.id))
+        self.assertIs(store.get(first.id), first)
+        self.assertIs(store.get(third.id), third)
+
+    def test_keeps_a_single_session_over_the_cap(self):
+        session = self.session()
+        store = sessions.SessionStore(1, 600)
+        store.add(session)
+        self.assertIs(store.get(session.id), session)
+
+    def test_evicts_idle_sessions(self):
+        session = self.session()
+        store = sessions.SessionStore(1 << 30, 600)
+        store.add(session)
+        store.add(self.session())
+        session.last_used -= 601
+        self.assertIsNone(store.get(session.id))
+
+    def test_discard(self):
+        session = self.session()
+        store = sessions.SessionStore(1 << 30, 600)
+        store.add(session)
+        self.assertTrue(store.discard(session.id))
+        self.assertFalse(store.discard(session.id))
@@ -0,0 +1,28 @@
+import json
+from django.test import SimpleTestCase
+import numpy as np
+
+BOUNDARIES = {"min_x": 0, "min_y": 0, "max_x": 1, "max_y": 1}
+
+
+class RelaxStreamTest(SimpleTestCase):
+    def post(self, data):
+        # the headers frontend/src/helpers/stream.js sends
+        return self.client.post("/api/relax/stream/", json.dumps(data), content_type="application/json",
+                                HTTP_ACCEPT="text/event-stream")
+
+    def test_streams_every_step(self):
+        points = np.random.default_rng(0).random((50, 2)).tolist()
+        response = self.post({"points": points, "boundaries": BOUNDARIES, "iterations": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        body = b"".join(response.streaming_content).decode("utf-8")
+        names = [line.split(": ", 1)[1] for line in body.splitlines() if line.startswith("event: ")]
+        self.assertEqual(names[-1], "done")
+        self.assertTrue(set(names[:-1]) <= {"iteration"} and names[:-1])
+
+    def test_errors_are_error_events(self):
+        response = self.post({"boundaries": BOUNDARIES})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.content.startswith(b"event: error\n"))
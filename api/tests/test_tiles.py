@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+from scipy.spatial import Voronoi
+from unittest import mock
+import numpy as np
+from api import clipping
+from api import tiles
+from api import voronoi
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+
+def length(edges):
+    return np.linalg.norm(edges[:, 1] - edges[:, 0], axis=1).sum()
+
+
+class TiledDiagramTest(SimpleTestCase):
+    def setUp(self):
+        self.points = np.random.default_rng(0).random((3000, 2))
+        self.vor = Voronoi(self.points)
+
+    def check(self, edges, centroids):
+        expected, _ = clipping.cell_centroids(self.vor, BOUNDS)
+        np.testing.assert_allclose(centroids, expected, atol=1e-12)
+        expected = voronoi.ridge_edges(self.vor, BOUNDS)
+        self.assertEqual(len(edges), len(expected))
+        self.assertAlmostEqual(length(edges), length(expected), places=9)
+
+    def test_matches_the_global_diagram(self):
+        self.check(*tiles.tiled_diagram(self.points, BOUNDS, 16))
+
+    def test_narrow_margin_is_redone_exactly(self):
+        # most cells near the tile borders come out inexact and take the retry paths
+        with mock.patch.object(tiles, "GHOST_SPACING", 0.5):
+            self.check(*tiles.tiled_diagram(self.points, BOUNDS, 16))
@@ -0,0 +1,30 @@
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+import numpy as np
+from api import wire
+
+
+class WireTest(SimpleTestCase):
+    def test_round_trip(self):
+        data = {"points": np.random.default_rng(0).random((5, 2)), "converged": True, "stats": [{"iteration": 1}]}
+        decoded = wire.decode(wire.encode(data))
+        np.testing.assert_array_equal(decoded["points"], data["points"])
+        self.assertEqual(decoded["converged"], True)
+        self.assertEqual(decoded["stats"], [{"iteration": 1}])
+
+    def test_index_arrays_are_sent_as_int32(self):
+        # the browser has no typed array for '<i8' that decodes into numbers
+        decoded = wire.decode(wire.encode({"removed": np.arange(4, dtype=np.intp), "mask": np.array([True, False])}))
+        self.assertEqual(decoded["removed"].dtype.str, "<i4")
+        np.testing.assert_array_equal(decoded["removed"], np.arange(4))
+        self.assertEqual(decoded["mask"].dtype.str, "|u1")
+
+    def test_wide_integers_out_of_range_are_refused(self):
+        with self.assertRaises(ValueError):
+            wire.encode({"removed": np.array([1 << 40])})
+
+    def test_int64_payloads_are_rejected(self):
+        body = bytearray(wire.encode({"removed": np.arange(4, dtype=np.int32)}))
+        body = bytes(body).replace(b'"<i4"', b'"<i8"')
+        with self.assertRaises(ParseError):
+            wire.decode(body)
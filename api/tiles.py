@@ -0,0 +1,156 @@
+from scipy.spatial import cKDTree, Voronoi, QhullError
+import numpy as np
+from . import clipping
+from . import metrics
+
+# ghost margin around a tile, in mean site spacings
+GHOST_SPACING = 3.0
+
+
+def layout(tiles, low, high):
+    # columns and rows of a grid of about the given number of tiles, as square as the extent allows
+    width, height = np.maximum(high - low, 1e-300)
+    columns = min(tiles, max(1, int(round(np.sqrt(tiles * width / height)))))
+    return columns, max(1, -(-tiles // columns))
+
+
+def tile_job(sites, index, owned, bounds, limits=None):
+    # diagram of one tile: its first `owned` sites and the ghosts around them, index holds their
+    # positions in the full point set. limits is the region the ghosts were taken from, infinite on
+    # the sides beyond the last site, or None when they hold every site the owned cells depend on.
+    # returns the centroids of the owned cells clipped to the box and which of them are exact; for
+    # the inexact ones the disks (x, y, radius) and neighbors their next attempt needs; and the
+    # edges of the exact cells towards sites of larger index, clipped to the box
+    try:
+        vor = Voronoi(sites)
+    except QhullError:
+        if limits is None:
+            raise
+        return np.zeros((owned, 2)), np.zeros(owned, dtype=bool), None, None, np.empty((0, 2, 2))
+
+    site_regions = vor.point_region[:owned]
+    regions = np.unique(site_regions)
+    polygons, counts, origin = clipping.closed_cells(vor, bounds, regions)
+    polygons, counts = clipping.clip_to_box(polygons, counts, bounds)
+    centroids, _, _ = clipping.polygon_moments(polygons, counts, origin)
+    rows = np.searchsorted(regions, site_regions)
+
+    # a site closer to a point of the cell than its own site lies in the disk around that point
+    # through the site. the disks around the cell vertices cover those around every point of the
+    # cell, so once they stay inside the region no site left out could cut the cell
+    reach = np.hypot(*(polygons - origin[:, None, :]).transpose(2, 0, 1))
+    if limits is None:
+        exact = np.ones(owned, dtype=bool)
+    else:
+        low, high = limits
+        inside = ((polygons - reach[..., None] > low) & (polygons + reach[..., None] < high)).all(axis=(1, 2))
+        exact = (inside | (counts == 0))[rows]
+
+    # every ridge is sent once, by the exact cell of its site with the smaller index
+    ridge_points = np.asarray(vor.ridge_points)
+    sender = np.where(index[ridge_points[:, 0]] < index[ridge_points[:, 1]], ridge_points[:, 0], ridge_points[:, 1])
+    sent = np.flatnonzero(sender < owned)
+    sent = sent[exact[sender[sent]]]
+
+    ridge_vertices = clipping.ridge_vertices(vor)[sent]
+    segments = vor.vertices[ridge_vertices]
+    infinite = (ridge_vertices == -1).any(axis=1)
+    if infinite.any():
+        lo, hi = clipping.outer_box(sites, bounds)
+        segments[infinite] = np.stack((vor.vertices[ridge_vertices[infinite].max(axis=1)],
+                                       clipping.far_points(vor, sent[infinite], lo, hi)), axis=1)
+    edges, _ = clipping.clip_segments(segments, bounds)
+
+    # with its neighbors kept a cell can only shrink, and the sites that could still cut it lie in
+    # the disks around its vertices, so these make the next attempt exact
+    failed = np.zeros(len(sites), dtype=bool)
+    failed[:owned] = ~exact
+    vertex = np.arange(polygons.shape[1])[None, :] < counts[:, None]
+    vertex &= np.isin(np.arange(len(regions)), rows[~exact])[:, None]
+    disks = np.column_stack((polygons[vertex], reach[vertex]))
+    neighbors = index[ridge_points[failed[ridge_points[:, ::-1]]]]
+
+    return centroids[rows], exact, disks, neighbors, edges
+
+
+def run_inline(function, items, costs):
+    return [function(*item) for item in items]
+
+
+def tiled_diagram(points, bounds, tiles, run=run_inline, timings=metrics.NULL_TIMINGS):
+    # centroids of every cell clipped to the box and the voronoi edges inside the box, from the
+    # diagrams of tiles of the box with a margin of ghost sites. run(function, items, costs) returns
+    # function(*item) for every item, in order, e.g. from worker processes. cells the margin left
+    # inexact are redone with the ghosts their first diagram asked for, or as part of a diagram of
+    # every site when those would be most of them
+    sites, inverse = np.unique(np.asarray(points, dtype=float), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n = len(sites)
+    low = np.minimum(bounds[:2], sites.min(axis=0))
+    high = np.maximum(bounds[2:], sites.max(axis=0))
+
+    columns, rows = layout(tiles, low, high)
+    size = np.maximum(high - low, 1e-300) / [columns, rows]
+    cell = np.minimum(((sites - low) / size).astype(np.intp), [columns - 1, rows - 1])
+    tile_of = cell[:, 0] * rows + cell[:, 1]
+    density = n / np.prod(np.maximum(high - low, 1e-300))
+    margin = GHOST_SPACING / np.sqrt(density)
+
+    items = []
+    for tile in np.unique(tile_of):
+        mine = tile_of == tile
+        column, row = divmod(tile, rows)
+        region_low = low + size * [column, row] - margin
+        region_high = low + size * [column + 1, row + 1] + margin
+        ghosts = np.flatnonzero(((sites >= region_low) & (sites <= region_high)).all(axis=1) & ~mine)
+
+        index = np.concatenate((np.flatnonzero(mine), ghosts))
+        limits = (np.where(region_low <= low, -np.inf, region_low), np.where(region_high >= high, np.inf, region_high))
+        items.append((sites[index], index, int(mine.sum()), bounds, limits))
+
+    centroids = np.empty_like(sites)
+    edges = []
+    tree = None
+
+    while items:
+        results = run(tile_job, items, [len(item[1]) for item in items])
+        timings.count("tiles", len(items))
+        timings.count("tile_rounds")
+
+        retries, everywhere = [], []
+        for (_, index, owned, _, _), (tile_centroids, exact, disks, neighbors, tile_edges) in zip(items, results):
+            done = index[:owned][exact]
+            centroids[done] = tile_centroids[exact]
+            edges.append(tile_edges)
+
+            failed = index[:owned][~exact]
+            if not len(failed):
+                continue
+            if disks is None:
+                everywhere.append(failed)
+                continue
+
+            if tree is None:
+                tree = cKDTree(sites)
+            # a little slack keeps the sites on the circles, which rounding may have moved out
+            radius = disks[:, 2] + 1e-9 * (np.abs(disks[:, :2]).max() + disks[:, 2])
+            # disks that would hold most sites at the mean density are cheaper as part of a full diagram
+            if len(failed) + density * np.pi * (radius ** 2).sum() > n // 2:
+                everywhere.append(failed)
+                continue
+
+            found = tree.query_ball_point(disks[:, :2], radius)
+            ghosts = np.setdiff1d(np.concatenate([neighbors] + [np.asarray(sites_found, dtype=np.intp) for sites_found in found]), failed)
+            index = np.concatenate((failed, ghosts))
+            retries.append((sites[index], index, len(failed), bounds, None))
+
+        if everywhere:
+            owned = np.concatenate(everywhere)
+            rest = np.ones(n, dtype=bool)
+            rest[owned] = False
+            index = np.concatenate((owned, np.flatnonzero(rest)))
+            retries.append((sites[index], index, len(owned), bounds, None))
+
+        items = retries
+
+    return np.concatenate(edges), centroids[inverse]
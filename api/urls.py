@@ -1,8 +1,20 @@
 from django.urls import path
 
-from . import voronoi
+from . import metrics, voronoi
 
 urlpatterns = [
     path("delaunay/", voronoi.delaunay),
     path("fortune/", voronoi.fortune),
+    path("tiled/", voronoi.tiled),
+    path("relax/", voronoi.relax),
+    path("relax/stream/", voronoi.relax_stream),
+    path("batch/", voronoi.batch),
+    path("densities/", voronoi.density_create),
+    path("domains/", voronoi.domain_create),
+    path("sessions/", voronoi.session_create),
+    path("sessions/<str:session_id>/", voronoi.session_update),
+    path("metrics/", metrics.report),
+    path("async/delaunay/", voronoi.delaunay_async),
+    path("async/fortune/", voronoi.fortune_async),
+    path("async/relax/", voronoi.relax_async),
 ]
\ No newline at end of file
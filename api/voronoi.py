@@ -1,109 +1,447 @@
-from shapely.geometry import Polygon, box, LineString
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from scipy.spatial import Voronoi
+from scipy.spatial import Voronoi, QhullError
+from concurrent.futures import as_completed, TimeoutError
 import logging
 import numpy as np
 from . import helper
+from . import cache
+from . import clipping
+from . import dcel
+from . import density
+from . import domain
+from . import executor
+from . import lloyd
+from . import metrics
+from . import sessions
+from . import streaming
+from . import tiles
+from . import wire
+from .beachline import BeachLine
 
 logger = logging.getLogger(__name__)
 
+MAX_ITERATIONS = 1000
+MAX_BATCH_JOBS = 1000
+MIN_BATCH_POINTS = 3
+BATCH_ALGORITHMS = ("delaunay", "fortune", "relax")
+MAX_TILES = 4096
+FIELDS = ("points", "edges", "centroids", "centroid_edges")
+TILE_SITES = getattr(settings, "ILLOYD_TILE_SITES", 250000)
+
+
+def ridge_edges(vor, bounds):
+    # voronoi ridges clipped to the boundary box as (start, end) pairs. semi-infinite ones run along
+    # their ray until they leave the box, ridges outside the box are dropped
+    ridge_vertices = clipping.ridge_vertices(vor)
+    segments = vor.vertices[ridge_vertices]
+
+    infinite = (ridge_vertices == -1).any(axis=1)
+    if infinite.any():
+        lo, hi = clipping.outer_box(vor.points, bounds)
+        segments[infinite] = np.stack((vor.vertices[ridge_vertices[infinite].max(axis=1)],
+                                       clipping.far_points(vor, np.flatnonzero(infinite), lo, hi)), axis=1)
+
+    edges, _ = clipping.clip_segments(segments, bounds)
+    return edges
+
+
+def relax_options(data):
+    # iteration budget, tolerance and acceleration (method with its parameters) of a relaxation
+    # request, raises ValueError or TypeError when invalid
+    iterations = int(data.get("iterations", 1))
+    tolerance = float(data.get("tolerance", 0.0))
+
+    if not 1 <= iterations <= MAX_ITERATIONS or tolerance < 0:
+        raise ValueError("iterations or tolerance out of range")
+
+    acceleration = {"method": data.get("method", "lloyd")}
+    acceleration.update({name: data[name] for name in ("omega", "depth", "samples", "chunk", "seed") if name in data})
+    lloyd.accelerator(**acceleration)
+
+    return iterations, tolerance, acceleration
+
+
+def output_options(data):
+    # outputs a diagram request asks for (every one by default), and the level of detail of its edges:
+    # a viewport box they are clipped to and the most of them to return. raises ValueError, TypeError
+    # or KeyError when invalid
+    fields = set(data.get("fields", FIELDS))
+    if not fields or not fields <= set(FIELDS):
+        raise ValueError("unknown fields")
+
+    viewport = None
+    if data.get("viewport") is not None:
+        viewport = lloyd.parse_boundaries(data["viewport"])
+        if not (viewport[0] < viewport[2] and viewport[1] < viewport[3]):
+            raise ValueError("empty viewport")
+
+    max_edges = None if data.get("max_edges") is None else int(data["max_edges"])
+    if max_edges is not None and max_edges < 1:
+        raise ValueError("max_edges out of range")
+
+    return fields, viewport, max_edges
+
+
+def invalid_output():
+    return Response({"error": "Invalid fields, viewport or max_edges."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def level_of_detail(edges, viewport=None, max_edges=None):
+    # the edges clipped to the viewport, and of those the longest max_edges in their original order.
+    # zoomed out, the short edges are the ones that vanish below a pixel first. the rows keep their
+    # shape, (start, end) pairs or (x1, y1, x2, y2)
+    if viewport is None and max_edges is None:
+        return edges
+    row = edges.shape[1:]
+    edges = edges.reshape(-1, 2, 2)
+
+    if viewport is not None:
+        edges, _ = clipping.clip_segments(edges, viewport)
+    if max_edges is not None and len(edges) > max_edges:
+        length = np.hypot(*(edges[:, 1] - edges[:, 0]).T)
+        edges = edges[np.sort(np.argpartition(length, len(edges) - max_edges)[len(edges) - max_edges:])]
+    return edges.reshape((-1,) + row)
+
+
+def diagram_response(request, fields, points, edges, centroids, viewport=None, max_edges=None):
+    # the requested outputs of a diagram. binary clients rebuild the centroid edges from points and
+    # centroids instead of receiving every coordinate twice, so they get those instead
+    arrays = wire.accepts_arrays(request)
+    rebuilt = "centroid_edges" in fields and arrays
+
+    result = {}
+    if "points" in fields or rebuilt:
+        result["points"] = points
+    if "edges" in fields:
+        result["edges"] = level_of_detail(edges, viewport, max_edges)
+    if "centroids" in fields or rebuilt:
+        result["centroids"] = centroids
+    if "centroid_edges" in fields and not arrays:
+        result["centroid_edges"] = np.stack((points, centroids), axis=1)
+
+    return wire.respond(request, result, status.HTTP_200_OK)
+
+
+def density_option(data):
+    # the uploaded density a request names, None when it names none. raises LookupError when it is
+    # not (or no longer) stored, the client then uploads it again
+    if data.get("density") is None:
+        return None
+    found = density.lookup(data["density"])
+    if found is None:
+        raise LookupError(data["density"])
+    return found
+
+
+def unknown_density():
+    return Response({"error": "Unknown density."}, status=status.HTTP_404_NOT_FOUND)
+
+
+def weights_option(data, bounds):
+    # the density or polygonal domain the cells of a request are weighted by (None when it names
+    # neither) and the box of the request. a domain.Domain is the density that is one inside its
+    # polygon, its bounding box replaces the boundaries: cells are clipped to the polygon, edges to
+    # the box. raises ValueError when both are named and LookupError like density_option
+    if data.get("domain") is None:
+        return density_option(data), bounds
+    if data.get("density") is not None:
+        raise ValueError("density and domain")
+    found = domain.lookup(data["domain"])
+    if found is None:
+        raise LookupError(data["domain"])
+    return found, found.bounds
+
+
+def unknown_weights(data):
+    if data.get("domain") is None:
+        return unknown_density()
+    return Response({"error": "Unknown domain."}, status=status.HTTP_404_NOT_FOUND)
+
+
+def combined_weights():
+    return Response({"error": "Density and domain cannot be combined."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@metrics.instrumented("delaunay")
 @csrf_exempt
 @api_view(["POST", ])
 def delaunay(request):
-    data = request.data
+    timings = request.timings
+
+    with timings.phase("parse"):
+        data = request.data
     
     if "points" not in data or "boundaries" not in data:
         return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
     
-    points = np.array(data["points"])
-    
-    vor = Voronoi(points)
+    with timings.phase("parse"):
+        points = np.asarray(data["points"], dtype=float)
+        bounds = lloyd.parse_boundaries(data["boundaries"])
 
-    min_x, min_y = data["boundaries"]["min_x"], data["boundaries"]["min_y"]
-    max_x, max_y = data["boundaries"]["max_x"], data["boundaries"]["max_y"]
+    try:
+        weights, bounds = weights_option(data, bounds)
+    except LookupError:
+        return unknown_weights(data)
+    except ValueError:
+        return combined_weights()
 
-    boundary = box(min_x, min_y, max_x, max_y)
-    
-    edges = []
-    center = vor.points.mean(axis=0)  # compute the center of all points
+    try:
+        fields, viewport, max_edges = output_options(data)
+    except (KeyError, TypeError, ValueError):
+        return invalid_output()
 
-    for point_idx, (p1, p2) in enumerate(vor.ridge_points):
-        v1, v2 = vor.ridge_vertices[point_idx]
+    # only the outputs the request asks for are computed, the cache entry collects them over requests
+    key = cache.key("delaunay", points, bounds, *([weights.key] if weights else []))
+    found = dict(cache.results.get(key) or {})
+    edges = "edges" in fields and "edges" not in found
+    cells = bool(fields & {"centroids", "centroid_edges"}) and "centroids" not in found
 
-        if -1 in (v1, v2):  # semi-infinite edge
-            if v1 == -1:
-                v_finite = v2
-            else:
-                v_finite = v1
+    if edges or cells:
+        with timings.phase("diagram"):
+            vor = Voronoi(points)
+            if edges:
+                found["edges"] = ridge_edges(vor, bounds)
 
-            # compute the direction of the ray
-            t = vor.points[p2] - vor.points[p1]
-            t /= np.linalg.norm(t)
-            n = np.array([-t[1], t[0]])
+        # centroids of every cell (weighted by the density if any), open cells are closed against the boundary
+        if cells:
+            with timings.phase("clip"):
+                found["centroids"], _ = clipping.cell_centroids(vor, bounds, density=weights)
 
-            midpoint = vor.points[[p1, p2]].mean(axis=0)
-            direction = np.sign(np.dot(midpoint - center, n)) * n
+        cache.results.put(key, found)
 
-            # extend ray sufficiently far
-            ray_length = 1000
-            ray_endpoint = vor.vertices[v_finite] + direction * ray_length
-            edges.append((vor.vertices[v_finite].tolist(), ray_endpoint.tolist()))
-        else:
-            edges.append((vor.vertices[v1].tolist(), vor.vertices[v2].tolist()))
-    
-    centroids = []
-    centroid_edges = []
-    for point_idx, region_idx in enumerate(vor.point_region):
-        vertices = vor.regions[region_idx]
-        
-        # Filter out open regions which have -1 as vertex
-        if -1 in vertices:
-            continue
-        
-        # Get the polygon points for the cell
-        poly_points = [vor.vertices[i] for i in vertices]
-        polygon = Polygon(poly_points)
-        
-        # Clip the polygon with the boundary
-        clipped_polygon = polygon.intersection(boundary)
-        
-        # Calculate the centroid of the clipped polygon
-        if not clipped_polygon.is_empty:
-            centroid = clipped_polygon.centroid.coords[0]  # Returns a tuple (x, y)
-            centroids.append([centroid[0], centroid[1]])
-            centroid_edges.append( [points[point_idx].tolist(), [centroid[0], centroid[1]] ] )
-        #else:
-            # Handle cases where the clipping results in an empty polygon
-            # return Response({}, status=status.HTTP_400_BAD_REQUEST)
-
-    return Response({"points": points, "edges": edges, "centroids": centroids, "centroid_edges": centroid_edges}, status=status.HTTP_200_OK)
+    return diagram_response(request, fields, points, found.get("edges"), found.get("centroids"), viewport, max_edges)
 
 
+@metrics.instrumented("relax")
 @csrf_exempt
 @api_view(["POST", ])
-def fortune(request):
+def relax(request):
+    timings = request.timings
+
+    with timings.phase("parse"):
+        data = request.data
+
+    if "points" not in data or "boundaries" not in data:
+        return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        iterations, tolerance, acceleration = relax_options(data)
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid iterations, tolerance or method."}, status=status.HTTP_400_BAD_REQUEST)
+
+    with timings.phase("parse"):
+        points = np.array(data["points"], dtype=float)
+        bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    try:
+        weights, bounds = weights_option(data, bounds)
+    except LookupError:
+        return unknown_weights(data)
+    except ValueError:
+        return combined_weights()
+
+    try:
+        sites, stats, converged = lloyd.relax(points, bounds, iterations, tolerance, timings, acceleration=acceleration, density=weights)
+    except QhullError:
+        return Response({"error": "Degenerate points."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return wire.respond(request, {"points": sites, "converged": converged, "stats": stats}, status.HTTP_200_OK)
+
+
+@metrics.instrumented("relax_stream")
+@csrf_exempt
+@api_view(["POST", ])
+@renderer_classes([JSONRenderer, streaming.EventStreamRenderer])
+def relax_stream(request):
     data = request.data
-    
+
     if "points" not in data or "boundaries" not in data:
         return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    points = np.array(data["points"])
+
+    try:
+        iterations, tolerance, acceleration = relax_options(data)
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid iterations, tolerance or method."}, status=status.HTTP_400_BAD_REQUEST)
+
+    points = np.asarray(data["points"], dtype=float)
+    bounds = lloyd.parse_boundaries(data["boundaries"])
+    include_edges = bool(data.get("edges", False))
+
+    try:
+        weights, bounds = weights_option(data, bounds)
+    except LookupError:
+        return unknown_weights(data)
+    except ValueError:
+        return combined_weights()
+
+    def events():
+        # every step is pushed as soon as it is computed, so the client draws while the next one runs
+        stat = None
+        try:
+            # the steps run while the body is sent, so their phases end up in the histograms of
+            # api/metrics/ but not in the Server-Timing header
+            for vor, sites, stat in lloyd.iterate(points, bounds, iterations, tolerance, request.timings, acceleration=acceleration, density=weights):
+                message = {**stat, "points": sites}
+                if include_edges and vor is not None:
+                    message["edges"] = ridge_edges(vor, bounds)
+                yield streaming.event("iteration", message)
+        except QhullError:
+            yield streaming.event("error", {"error": "Degenerate points."})
+            return
+
+        converged = stat is not None and stat["max_residual"] <= tolerance
+        yield streaming.event("done", {"converged": converged, "iterations": stat["iteration"] if stat else 0})
+
+    return streaming.event_stream(events())
+
+
+@csrf_exempt
+@api_view(["POST", ])
+def density_create(request):
+    # a raster density (rows from min_y up, columns from min_x right) is uploaded once, later requests
+    # name it by the returned key to get weighted centroids
+    data = request.data
+
+    if "density" not in data or "boundaries" not in data:
+        return Response({"error": "Missing density."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        key = density.upload(data["density"], lloyd.parse_boundaries(data["boundaries"]))
+    except (KeyError, TypeError, ValueError):
+        return Response({"error": "Invalid density."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({"density": key}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@api_view(["POST", ])
+def domain_create(request):
+    # a polygonal domain (a GeoJSON Polygon or MultiPolygon, holes included) is uploaded once and
+    # prepared by the worker that first uses it, later requests name it by the returned key to have
+    # their cells clipped to it
+    data = request.data
+
+    if "domain" not in data:
+        return Response({"error": "Missing domain."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        key = domain.upload(data["domain"])
+    except ValueError:
+        return Response({"error": "Invalid domain."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({"domain": key}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@api_view(["POST", ])
+def session_create(request):
+    data = request.data
+
+    if "points" not in data or "boundaries" not in data:
+        return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
+
+    points = np.asarray(data["points"], dtype=float)
+    bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    try:
+        session = sessions.Session(points, bounds)
+    except QhullError:
+        return Response({"error": "Degenerate points."}, status=status.HTTP_400_BAD_REQUEST)
+    sessions.store.add(session)
+
+    return Response({"session": session.id, "points": session.sites, "centroids": session.centroids}, status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@api_view(["POST", "DELETE"])
+def session_update(request, session_id):
+    if request.method == "DELETE":
+        if not sessions.store.discard(session_id):
+            return Response({"error": "Unknown session."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    session = sessions.store.get(session_id)
+    if session is None:
+        return Response({"error": "Unknown session."}, status=status.HTTP_404_NOT_FOUND)
+
+    data = request.data
+    try:
+        steps = int(data.get("step", 0))
+        remove = np.asarray(data.get("remove", []), dtype=np.intp).ravel()
+        add = np.asarray(data.get("add", []), dtype=float).reshape(-1, 2)
+        # incremental steps freeze the sites within tolerance of their centroid
+        incremental = bool(data.get("incremental", False))
+        tolerance = float(data.get("tolerance", 0.0))
+        if not 0 <= steps <= MAX_ITERATIONS or not 0.0 <= tolerance < np.inf:
+            raise ValueError(steps)
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid update."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # deltas are applied in order: removals, additions (appended at the end), then lloyd steps
+    removed = changed = np.empty(0, dtype=np.intp)
+    active = None
+    with session.lock:
+        if remove.size and (remove.min() < 0 or remove.max() >= len(session.sites)):
+            return Response({"error": "Invalid update."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if remove.size:
+                removed, changed = session.remove(remove)
+            if len(add):
+                changed = np.union1d(changed, session.add(add))
+            if steps and incremental:
+                stepped, active = session.step_incremental(steps, tolerance)
+                changed = np.union1d(changed, stepped)
+            elif steps:
+                changed = np.union1d(changed, session.step(steps))
+        except (QhullError, RuntimeError):
+            # the triangulation may be half updated, drop the session rather than serve a broken one
+            sessions.store.discard(session.id)
+            return Response({"error": "Degenerate points, session closed."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = {
+            "session": session.id,
+            "size": len(session.sites),
+            "removed": removed,
+            "added": len(add),
+            "changed": changed,
+            "points": session.sites[changed],
+            "centroids": session.centroids[changed],
+        }
+        # sites the last incremental step moved, 0 once they are all frozen
+        if active is not None:
+            result["active"] = active
+
+    sessions.store.touched()
+    return Response(result, status=status.HTTP_200_OK)
+
+
+def fortune_sweep(points, bounds, checkpoint=None):
+    # fortune's sweep over the sites, returns the voronoi edges as (x1, y1, x2, y2) rows, the indices
+    # of the two sites of every edge and event counts.
+    # checkpoint is called every thousand or so site events and may raise to abandon the sweep
+
+    # tracing is checked once, so the sweep pays nothing for it unless debug logging is on
+    trace = logger.isEnabledFor(logging.DEBUG)
+    site_events = circle_events = 0
+    last_x = None
 
     voronoi_edges = []
-    active_arcs = None
+    beach_line = BeachLine()
 
     event_queue_sites = helper.PriorityQueue()
     event_queue_circles = helper.PriorityQueue()
 
-    min_x, min_y = data["boundaries"]["min_x"], data["boundaries"]["min_y"]
-    max_x, max_y = data["boundaries"]["max_x"], data["boundaries"]["max_y"]
+    min_x, min_y, max_x, max_y = bounds
 
     # insert points into the site events queue and update the bounding box
-    for pt in points:
-        event_point = helper.Point(pt[0], pt[1])
+    for index, pt in enumerate(points):
+        event_point = helper.Point(pt[0], pt[1], index)
         event_queue_sites.push(event_point)
         min_x = min(min_x, event_point.x)
         min_y = min(min_y, event_point.y)
@@ -125,16 +463,22 @@ def fortune(request):
             current_event = event_queue_circles.pop()
 
             if current_event.valid:
-                new_edge = helper.Segment(current_event.point)
-                voronoi_edges.append(new_edge)
+                circle_events += 1
+                last_x = current_event.x
+                if trace:
+                    logger.debug("circle event at x=%f, vertex (%f, %f)", current_event.x, current_event.point.x, current_event.point.y)
 
                 # remove the associated arc and update neighboring arcs
                 current_arc = current_event.arc
+                beach_line.remove(current_arc)
+
+                # the new edge separates the sites of the arcs that now meet
+                new_edge = helper.Segment(current_event.point, (current_arc.prev.point.index, current_arc.next.point.index))
+                voronoi_edges.append(new_edge)
+
                 if current_arc.prev is not None:
-                    current_arc.prev.next = current_arc.next
                     current_arc.prev.right_segment = new_edge
                 if current_arc.next is not None:
-                    current_arc.next.prev = current_arc.prev
                     current_arc.next.left_segment = new_edge
 
                 # complete edges connected to the removed arc
@@ -146,66 +490,55 @@ def fortune(request):
                 # recheck circle events on either side of the removed arc
                 if current_arc.prev is not None: helper.check_circle_event(current_arc.prev, min_x, event_queue_circles)
                 if current_arc.next is not None: helper.check_circle_event(current_arc.next, min_x, event_queue_circles)
-        
+    
         else:
             # handle site event
             point = event_queue_sites.pop()
+            site_events += 1
+            if checkpoint is not None and site_events % 1024 == 0:
+                checkpoint()
+            if trace:
+                logger.debug("site event at (%f, %f)", point.x, point.y)
+
             # insert new arc for the site event
-            if active_arcs is None:
-                active_arcs = helper.Arc(point)
+            if beach_line.empty():
+                beach_line.insert_after(None, helper.Arc(point))
             else:
                 # find the arc above the new site point and insert the new arc
-                found_intersection = False
-                arc = active_arcs
-                while arc is not None:
-                    intersects, intersection_point = helper.intersect(point, arc)
-                    if intersects:
-                        # the new parabola intersects the arc at this point in the beach line
-                        intersects_next, _ = helper.intersect(point, arc.next)
-                        if arc.next is not None and not intersects_next:
-                            arc.next.prev = helper.Arc(arc.point, arc, arc.next)
-                            arc.next = arc.next.prev
-                        else:
-                            arc.next = helper.Arc(arc.point, arc)
-                        arc.next.right_segment = arc.right_segment
-
-                        # insert the new point between arc and arc.next
-                        arc.next.prev = helper.Arc(point, arc, arc.next)
-                        arc.next = arc.next.prev
-
-                        arc = arc.next
-
-                        # create new edges at the intersection points
-                        new_segment = helper.Segment(intersection_point)
-                        voronoi_edges.append(new_segment)
-                        arc.prev.right_segment = arc.left_segment = new_segment
-
-                        new_segment = helper.Segment(intersection_point)
-                        voronoi_edges.append(new_segment)
-                        arc.next.left_segment = arc.right_segment = new_segment
-
-                        # check for potential circle events around the new arc
-                        helper.check_circle_event(arc, min_x, event_queue_circles)
-                        helper.check_circle_event(arc.prev, min_x, event_queue_circles)
-                        helper.check_circle_event(arc.next, min_x, event_queue_circles)
-
-                        found_intersection = True
-                        break
-                    
-                    arc = arc.next
-
-                if not found_intersection:
+                arc = beach_line.locate(point)
+                intersects, intersection_point = helper.intersect(point, arc)
+                if intersects:
+                    # the new parabola intersects the arc at this point in the beach line, split it in two
+                    beach_line.insert_after(arc, helper.Arc(arc.point))
+                    arc.next.right_segment = arc.right_segment
+
+                    # insert the new point between arc and arc.next
+                    arc = beach_line.insert_after(arc, helper.Arc(point))
+
+                    # create new edges at the intersection points
+                    new_segment = helper.Segment(intersection_point, (arc.prev.point.index, point.index))
+                    voronoi_edges.append(new_segment)
+                    arc.prev.right_segment = arc.left_segment = new_segment
+
+                    new_segment = helper.Segment(intersection_point, (point.index, arc.next.point.index))
+                    voronoi_edges.append(new_segment)
+                    arc.next.left_segment = arc.right_segment = new_segment
+
+                    # check for potential circle events around the new arc
+                    helper.check_circle_event(arc, min_x, event_queue_circles)
+                    helper.check_circle_event(arc.prev, min_x, event_queue_circles)
+                    helper.check_circle_event(arc.next, min_x, event_queue_circles)
+
+                else:
                     # if the new point does not intersect with any existing arcs, append it to the end of the list
-                    arc = active_arcs
-                    while arc.next is not None:
-                        arc = arc.next
-                    arc.next = helper.Arc(point, arc)
-                    
+                    arc = beach_line.tail
+                    beach_line.insert_after(arc, helper.Arc(point))
+                
                     # insert a new segment between the new point and the last arc on the beach line
                     mid_y = (arc.next.point.y + arc.point.y) / 2.0
                     start_point = helper.Point(min_x, mid_y)
 
-                    new_segment = helper.Segment(start_point)
+                    new_segment = helper.Segment(start_point, (arc.point.index, arc.next.point.index))
                     arc.right_segment = arc.next.left_segment = new_segment
                     voronoi_edges.append(new_segment)
 
@@ -215,16 +548,21 @@ def fortune(request):
         current_event = event_queue_circles.pop()
 
         if current_event.valid:
-            new_edge = helper.Segment(current_event.point)
-            voronoi_edges.append(new_edge)
+            circle_events += 1
+            last_x = current_event.x
+            if trace:
+                logger.debug("circle event at x=%f, vertex (%f, %f)", current_event.x, current_event.point.x, current_event.point.y)
 
             # remove the associated arc and update neighboring arcs
             arc = current_event.arc
+            beach_line.remove(arc)
+
+            new_edge = helper.Segment(current_event.point, (arc.prev.point.index, arc.next.point.index))
+            voronoi_edges.append(new_edge)
+
             if arc.prev is not None:
-                arc.prev.next = arc.next
                 arc.prev.right_segment = new_edge
             if arc.next is not None:
-                arc.next.prev = arc.prev
                 arc.next.left_segment = new_edge
 
             # complete edges connected to the removed arc
@@ -235,20 +573,349 @@ def fortune(request):
             if arc.prev is not None: helper.check_circle_event(arc.prev, min_x, event_queue_circles)
             if arc.next is not None: helper.check_circle_event(arc.next, min_x, event_queue_circles)
 
-    
-    l = max_x + (max_x - min_x) + (max_y - min_y)
-    current_arc = active_arcs
+    # the remaining breakpoints run off to infinity, the open edges are finished where they are once
+    # the sweep line is well past the box and past the last vertex, which can lie far outside the box
+    l = max(max_x, last_x if last_x is not None else max_x) + 2.0 * ((max_x - min_x) + (max_y - min_y))
+    current_arc = beach_line.head
     while current_arc.next is not None:
         if current_arc.right_segment is not None:
-            point = helper.intersection(current_arc.point, current_arc.next.point, l*2.0)
+            point = helper.intersection(current_arc.point, current_arc.next.point, l)
             current_arc.right_segment.finish(point)
         current_arc = current_arc.next
 
-    # convert edges to a list of tuples for output
+    # convert edges to a list of tuples for output, with the two sites of every edge
     edges = []
     for edge in voronoi_edges:
         start_point = edge.start
         end_point = edge.end
         edges.append((start_point.x, start_point.y, end_point.x, end_point.y))
 
-    return Response({"points": points, "edges": edges, "centroids": [], "centroid_edges": []}, status=status.HTTP_200_OK)
\ No newline at end of file
+    edges = np.array(edges, dtype=float).reshape(-1, 4)
+    edge_sites = np.array([edge.sites for edge in voronoi_edges], dtype=np.intp).reshape(-1, 2)
+
+    return edges, edge_sites, {"site_events": site_events, "circle_events": circle_events, "invalidated_events": event_queue_circles.removed}
+
+
+def fortune_diagram(points, bounds, checkpoint=None, timings=metrics.NULL_TIMINGS, density=None, cells=True):
+    # one sweep gives the edges, their half-edge structure closes the cells against the box. the
+    # sweep runs over the distinct sites, duplicates share the centroid of their cell as with qhull.
+    # without cells the centroids are None
+    sites, inverse = np.unique(points, axis=0, return_inverse=True)
+
+    with timings.phase("diagram"):
+        edges, edge_sites, events = fortune_sweep(sites, bounds, checkpoint)
+    if not cells:
+        return edges, None, events
+    with timings.phase("clip"):
+        centroids, _ = dcel.HalfEdges(edges, edge_sites, sites).cell_centroids(bounds, density)
+
+    return edges, centroids[inverse.reshape(-1)], events
+
+
+@metrics.instrumented("fortune")
+@csrf_exempt
+@api_view(["POST", ])
+def fortune(request):
+    timings = request.timings
+
+    with timings.phase("parse"):
+        data = request.data
+    
+    if "points" not in data or "boundaries" not in data:
+        return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with timings.phase("parse"):
+        points = np.asarray(data["points"], dtype=float)
+        bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    try:
+        weights, bounds = weights_option(data, bounds)
+    except LookupError:
+        return unknown_weights(data)
+    except ValueError:
+        return combined_weights()
+
+    try:
+        fields, viewport, max_edges = output_options(data)
+    except (KeyError, TypeError, ValueError):
+        return invalid_output()
+
+    # the sweep runs only for outputs the request asks for and the cache lacks. it always yields the
+    # edges, closing the cells is skipped unless centroids are missing
+    key = cache.key("fortune", points, bounds, *([weights.key] if weights else []))
+    found = dict(cache.results.get(key) or {})
+    edges = "edges" in fields and "edges" not in found
+    cells = bool(fields & {"centroids", "centroid_edges"}) and "centroids" not in found
+
+    if edges or cells:
+        found["edges"], centroids, events = fortune_diagram(points, bounds, timings=timings, density=weights, cells=cells)
+        if cells:
+            found["centroids"] = centroids
+        cache.results.put(key, found)
+
+        for name, value in events.items():
+            timings.count(name, value)
+
+    return diagram_response(request, fields, points, found.get("edges"), found.get("centroids"), viewport, max_edges)
+
+
+@metrics.instrumented("tiled")
+@csrf_exempt
+@api_view(["POST", ])
+def tiled(request):
+    # the delaunay diagram computed tile by tile in the worker pool, its edges are clipped to the box
+    timings = request.timings
+
+    with timings.phase("parse"):
+        data = request.data
+
+    if "points" not in data or "boundaries" not in data:
+        return Response({"error": "Missing points."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # the tiles run in the worker processes, which do not hold the uploaded densities and domains
+    if data.get("density") is not None or data.get("domain") is not None:
+        return Response({"error": "Density and domain are not supported here."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        tile_count = int(data.get("tiles", 2 * executor.pool.workers))
+        if not 1 <= tile_count <= MAX_TILES:
+            raise ValueError(tile_count)
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid tiles."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        fields, viewport, max_edges = output_options(data)
+    except (KeyError, TypeError, ValueError):
+        return invalid_output()
+
+    with timings.phase("parse"):
+        points = np.asarray(data["points"], dtype=float)
+        bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    key = cache.key("tiled", points, bounds)
+    cached = cache.results.get(key)
+
+    if cached is None:
+        # no tile holds more than TILE_SITES sites, and small diagrams are not worth shipping to the workers
+        tile_count = max(tile_count, -(-len(points) // TILE_SITES))
+        run = tiles.run_inline if len(points) < executor.pool.inline_points else executor.pool.starmap
+
+        try:
+            with timings.phase("diagram"):
+                edges, centroids = tiles.tiled_diagram(points, bounds, tile_count, run, timings)
+        except (QhullError, ValueError):
+            return Response({"error": "Degenerate points."}, status=status.HTTP_400_BAD_REQUEST)
+        except executor.Overloaded:
+            return Response({"error": "Too many pending jobs."}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
+        except TimeoutError:
+            return Response({"error": "Job timed out."}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+
+        cache.results.put(key, {"edges": edges, "centroids": centroids})
+    else:
+        edges, centroids = cached["edges"], cached["centroids"]
+
+    # every tile yields its edges and centroids together, so only the response is cut down
+    return diagram_response(request, fields, points, edges, centroids, viewport, max_edges)
+
+# jobs of the async views, they run in the worker processes of executor.pool (or inline when small)
+# and return dicts of arrays and plain values
+
+def delaunay_job(points, bounds, checkpoint):
+    vor = Voronoi(points)
+    edges = ridge_edges(vor, bounds)
+    checkpoint()
+    centroids, _ = clipping.cell_centroids(vor, bounds)
+    return {"edges": edges, "centroids": centroids}
+
+
+def fortune_job(points, bounds, checkpoint):
+    edges, centroids, events = fortune_diagram(points, bounds, checkpoint)
+    return {"edges": edges, "centroids": centroids, **events}
+
+
+def relax_job(points, bounds, checkpoint, iterations=1, tolerance=0.0, acceleration=None):
+    sites, stats, converged = lloyd.relax(points, bounds, iterations, tolerance, checkpoint=checkpoint, acceleration=acceleration)
+    return {"points": sites, "stats": stats, "converged": converged}
+
+
+@executor.offloaded
+async def delaunay_async(request, data):
+    if "points" not in data or "boundaries" not in data:
+        return wire.respond(request, {"error": "Missing points."}, status.HTTP_400_BAD_REQUEST)
+    if data.get("density") is not None or data.get("domain") is not None:
+        return wire.respond(request, {"error": "Density and domain are not supported here."}, status.HTTP_400_BAD_REQUEST)
+
+    points = np.asarray(data["points"], dtype=float)
+    bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    key = cache.key("delaunay", points, bounds)
+    cached = cache.results.get(key)
+
+    if cached is None:
+        try:
+            cached = await executor.pool.run(delaunay_job, points, bounds)
+        except QhullError:
+            return wire.respond(request, {"error": "Degenerate points."}, status.HTTP_400_BAD_REQUEST)
+        cache.results.put(key, cached)
+
+    result = {"points": points, "edges": cached["edges"], "centroids": cached["centroids"]}
+    if not wire.accepts_arrays(request):
+        result["centroid_edges"] = np.stack((points, cached["centroids"]), axis=1)
+
+    return wire.respond(request, result, status.HTTP_200_OK)
+
+
+@executor.offloaded
+async def fortune_async(request, data):
+    if "points" not in data or "boundaries" not in data:
+        return wire.respond(request, {"error": "Missing points."}, status.HTTP_400_BAD_REQUEST)
+    if data.get("density") is not None or data.get("domain") is not None:
+        return wire.respond(request, {"error": "Density and domain are not supported here."}, status.HTTP_400_BAD_REQUEST)
+
+    points = np.asarray(data["points"], dtype=float)
+    bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    key = cache.key("fortune", points, bounds)
+    cached = cache.results.get(key)
+
+    if cached is None:
+        result = await executor.pool.run(fortune_job, points, bounds)
+        cached = {"edges": result["edges"], "centroids": result["centroids"]}
+        cache.results.put(key, cached)
+
+    result = {"points": points, "edges": cached["edges"], "centroids": cached["centroids"]}
+    if not wire.accepts_arrays(request):
+        result["centroid_edges"] = np.stack((points, cached["centroids"]), axis=1)
+
+    return wire.respond(request, result, status.HTTP_200_OK)
+
+
+@executor.offloaded
+async def relax_async(request, data):
+    if "points" not in data or "boundaries" not in data:
+        return wire.respond(request, {"error": "Missing points."}, status.HTTP_400_BAD_REQUEST)
+    if data.get("density") is not None or data.get("domain") is not None:
+        return wire.respond(request, {"error": "Density and domain are not supported here."}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        iterations, tolerance, acceleration = relax_options(data)
+    except (TypeError, ValueError):
+        return wire.respond(request, {"error": "Invalid iterations, tolerance or method."}, status.HTTP_400_BAD_REQUEST)
+
+    points = np.asarray(data["points"], dtype=float)
+    bounds = lloyd.parse_boundaries(data["boundaries"])
+
+    try:
+        result = await executor.pool.run(relax_job, points, bounds, len(points) * iterations, iterations=iterations, tolerance=tolerance, acceleration=acceleration)
+    except QhullError:
+        return wire.respond(request, {"error": "Degenerate points."}, status.HTTP_400_BAD_REQUEST)
+
+    return wire.respond(request, result, status.HTTP_200_OK)
+
+
+def batch_entry(job):
+    # algorithm, points, bounds and relaxation options of one batch job, raises when invalid
+    algorithm = job.get("algorithm", "delaunay")
+    if algorithm not in BATCH_ALGORITHMS or job.get("density") is not None or job.get("domain") is not None:
+        raise ValueError(algorithm)
+
+    points = np.asarray(job["points"], dtype=float).reshape(-1, 2)
+    # fewer than three sites have no planar diagram, qhull refuses them and the sweep breaks on none
+    if len(points) < MIN_BATCH_POINTS or not np.isfinite(points).all():
+        raise ValueError(len(points))
+    bounds = lloyd.parse_boundaries(job["boundaries"])
+    iterations, tolerance, acceleration = relax_options(job)
+    return algorithm, points, bounds, iterations, tolerance, acceleration
+
+
+def batch_job(algorithm, points, bounds, iterations, tolerance, acceleration):
+    # one job of a batch, a degenerate point set or any other failure is reported in its own result
+    # instead of failing the batch (or the chunk it runs in)
+    try:
+        if algorithm == "delaunay":
+            return {"points": points, **delaunay_job(points, bounds, executor.no_checkpoint)}
+        if algorithm == "fortune":
+            edges, centroids, _ = fortune_diagram(points, bounds)
+            return {"points": points, "edges": edges, "centroids": centroids}
+        return relax_job(points, bounds, executor.no_checkpoint, iterations, tolerance, acceleration)
+    except QhullError:
+        return {"error": "Degenerate points."}
+    except Exception:
+        logger.exception("batch job failed: %s on %d points", algorithm, len(points))
+        return {"error": "Job failed."}
+
+
+@csrf_exempt
+@api_view(["POST", ])
+def batch(request):
+    jobs = request.data.get("jobs")
+
+    if not isinstance(jobs, list) or not jobs:
+        return Response({"error": "Missing jobs."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(jobs) > MAX_BATCH_JOBS:
+        return Response({"error": f"At most {MAX_BATCH_JOBS} jobs per batch."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # invalid jobs get their error right away, the others run in the worker pool
+    results = [None] * len(jobs)
+    items, positions = [], []
+    for index, job in enumerate(jobs):
+        try:
+            items.append(batch_entry(job))
+            positions.append(index)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            results[index] = {"error": "Invalid job."}
+
+    # a batch small enough is cheaper to run here than to ship to the workers
+    costs = [len(points) * (iterations if algorithm == "relax" else 1) for algorithm, points, _, iterations, _, _ in items]
+    inline = sum(costs) < executor.pool.inline_points
+
+    try:
+        chunks = [] if inline else executor.pool.map(batch_job, items, costs)
+    except executor.Overloaded:
+        return Response({"error": "Too many pending jobs."}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
+
+    def finished():
+        # (index, result) of every valid job, in the order the chunks complete
+        if inline:
+            for position, item in zip(positions, items):
+                yield position, batch_job(*item)
+            return
+
+        futures = {future: (start, stop) for future, start, stop in chunks}
+        deadline = executor.pool.timeout * -(-len(chunks) // executor.pool.workers)
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                start, stop = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception:
+                    outcome = [{"error": "Job failed."}] * (stop - start)
+                for offset, result in enumerate(outcome):
+                    yield positions[start + offset], result
+        except TimeoutError:
+            for future, (start, stop) in futures.items():
+                if not future.done():
+                    for position in positions[start:stop]:
+                        yield position, {"error": "Job timed out."}
+        finally:
+            # nothing waits for the queued chunks any more, e.g. the client of a stream went away
+            for future in futures:
+                future.cancel()
+
+    if not request.data.get("stream", False):
+        for position, result in finished():
+            results[position] = result
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def events():
+        errors = 0
+        for index, result in enumerate(results):
+            if result is not None:
+                errors += 1
+                yield streaming.event("result", {"index": index, **result})
+        for position, result in finished():
+            errors += "error" in result
+            yield streaming.event("result", {"index": position, **result})
+        yield streaming.event("done", {"jobs": len(jobs), "errors": errors})
+
+    return streaming.event_stream(events())
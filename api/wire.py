@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+import json
+import math
+import struct
+import numpy as np
+
+# binary payload: magic, little-endian uint32 header length, JSON header, then the raw little-endian
+# array buffers, each starting on an 8 byte boundary. the header holds the plain JSON fields and the
+# dtype, shape and offset (relative to the first buffer) of every array
+MEDIA_TYPE = "application/x-illoyd-arrays"
+MAGIC = b"ILYD"
+ALIGNMENT = 8
+DTYPES = {"<f8", "<f4", "<i4", "<u4", "|u1"}
+
+# the typed arrays the browser decodes into have no 64 bit integers that behave like numbers, so
+# wider integers (the np.intp index arrays) and booleans are sent as these
+NARROWED = {"i": np.dtype("<i4"), "u": np.dtype("<u4"), "b": np.dtype("|u1")}
+
+# streamed responses hold at most this many array rows (or bytes of an array buffer) as a copy at once
+CHUNK_ROWS = 4096
+CHUNK_BYTES = 1 << 20
+
+# responses whose arrays hold at least this many rows are streamed
+STREAM_ROWS = getattr(settings, "ILLOYD_STREAM_MIN_ROWS", 10000)
+
+
+def aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def wire_dtype(array):
+    # little-endian dtype of an array in the payload, one of DTYPES. raises ValueError for integers
+    # that do not fit into 32 bits
+    dtype = array.dtype.newbyteorder("<")
+    if dtype.str in DTYPES:
+        return dtype
+    if dtype.kind in NARROWED:
+        narrowed = NARROWED[dtype.kind]
+        if dtype.kind != "b" and array.size and (array.min() < np.iinfo(narrowed).min or array.max() > np.iinfo(narrowed).max):
+            raise ValueError(f"integers out of range for {narrowed.str}")
+        return narrowed
+    if dtype.kind == "f":
+        return np.dtype("<f8")
+    raise ValueError(f"unsupported dtype {array.dtype}")
+
+
+def encode(data):
+    return b"".join(encode_chunks(data))
+
+
+def encode_chunks(data):
+    # the array format in pieces: numpy arrays are written as raw buffers, sliced without copying,
+    # everything else goes into the header
+    fields, arrays = {}, {}
+    for name, value in data.items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = np.ascontiguousarray(value, dtype=wire_dtype(value))
+        else:
+            fields[name] = value
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += aligned(array.nbytes)
+
+    header = json.dumps({"fields": fields, "arrays": layout}, cls=JSONEncoder).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+
+    yield prefix + bytes(aligned(len(prefix)) - len(prefix))
+    for array in arrays.values():
+        buffer = array.data.cast("B")
+        for start in range(0, array.nbytes, CHUNK_BYTES):
+            yield buffer[start:start + CHUNK_BYTES]
+        yield bytes(aligned(array.nbytes) - array.nbytes)
+
+
+def json_chunks(data):
+    # compact JSON of a dict in pieces, as the JSON renderer writes it. numpy arrays are converted
+    # to lists a block of rows at a time, so the whole array never exists as python objects
+    dumps = lambda value: json.dumps(value, cls=JSONEncoder, separators=(",", ":"))
+    yield "{"
+    for position, (name, value) in enumerate(data.items()):
+        yield ("," if position else "") + dumps(name) + ":"
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            yield "["
+            for start in range(0, len(value), CHUNK_ROWS):
+                yield ("," if start else "") + dumps(value[start:start + CHUNK_ROWS].tolist())[1:-1]
+            yield "]"
+        else:
+            yield dumps(value)
+    yield "}"
+
+
+def decode(body):
+    # arrays come back as read-only views on the request body, no copy is made
+    if len(body) < 8 or body[:4] != MAGIC:
+        raise ParseError("Invalid array payload.")
+
+    (header_length,) = struct.unpack_from("<I", body, 4)
+    start = 8 + header_length
+    if start > len(body):
+        raise ParseError("Invalid array payload.")
+
+    try:
+        header = json.loads(bytes(body[8:start]).decode("utf-8"))
+        data = dict(header.get("fields", {}))
+        layout = header.get("arrays", {})
+    except (ValueError, AttributeError):
+        raise ParseError("Invalid array payload.")
+
+    base = aligned(start)
+    for name, spec in layout.items():
+        try:
+            if spec["dtype"] not in DTYPES:
+                raise ValueError(spec["dtype"])
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(int(dim) for dim in spec["shape"])
+            offset = base + int(spec["offset"])
+        except (KeyError, TypeError, ValueError):
+            raise ParseError(f"Invalid array description for {name}.")
+
+        count = math.prod(shape)
+        if min(shape, default=0) < 0 or offset < base or offset + count * dtype.itemsize > len(body):
+            raise ParseError(f"Array {name} is out of bounds.")
+
+        data[name] = np.frombuffer(body, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    return data
+
+
+def accepts_arrays(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    if renderer is None:
+        # plain django request of an async view, not negotiated by DRF
+        return MEDIA_TYPE in request.headers.get("Accept", "")
+    return renderer.media_type == MEDIA_TYPE
+
+
+def parse_request(request):
+    # body of a plain django request, for the async views that run outside of DRF
+    if request.content_type == MEDIA_TYPE:
+        return decode(request.body)
+
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ParseError("JSON parse error.")
+    if not isinstance(data, dict):
+        raise ParseError("Expected a JSON object.")
+    return data
+
+
+def respond(request, data, status=200):
+    # response in the array format when the client asks for it, JSON otherwise. results with many
+    # array rows are encoded while they are sent, other ones go through DRF when the request came
+    # through it (so the browsable API keeps working)
+    rows = sum(len(value) for value in data.values() if isinstance(value, np.ndarray) and value.ndim > 0)
+    renderer = getattr(request, "accepted_renderer", None)
+
+    if rows >= STREAM_ROWS:
+        if accepts_arrays(request):
+            return StreamingHttpResponse(encode_chunks(data), status=status, content_type=MEDIA_TYPE)
+        if renderer is None or renderer.media_type == "application/json":
+            return StreamingHttpResponse(json_chunks(data), status=status, content_type="application/json")
+
+    if renderer is not None:
+        return Response(data, status=status)
+    if accepts_arrays(request):
+        return HttpResponse(encode(data), status=status, content_type=MEDIA_TYPE)
+    return HttpResponse(json.dumps(data, cls=JSONEncoder), status=status, content_type="application/json")
+
+
+class ArrayParser(BaseParser):
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            raise ParseError("Empty array payload.")
+        return decode(stream.read())
+
+
+class ArrayRenderer(BaseRenderer):
+    media_type = MEDIA_TYPE
+    format = "arrays"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return encode(data)
@@ -0,0 +1,51 @@
+import numpy as np
+
+# every distribution fills the same box, which is also sent as the boundaries
+BOX = (0.0, 0.0, 1000.0, 1000.0)
+
+
+def reflect(points):
+    # fold points that fell outside the box back inside, instead of piling them up on its edges
+    low, high = np.array(BOX[:2]), np.array(BOX[2:])
+    size = high - low
+    offset = np.mod(points - low, 2 * size)
+    return low + np.where(offset > size, 2 * size - offset, offset)
+
+
+def uniform(n, rng):
+    return rng.uniform(BOX[:2], BOX[2:], size=(n, 2))
+
+
+def clustered(n, rng):
+    # gaussian blobs around sqrt(n) / 4 random centers
+    k = max(1, int(np.sqrt(n) / 4))
+    centers = uniform(k, rng)
+    spread = (BOX[2] - BOX[0]) / (4 * np.sqrt(k))
+    points = centers[rng.integers(k, size=n)] + rng.normal(scale=spread, size=(n, 2))
+    return reflect(points)
+
+
+def near_collinear(n, rng):
+    # a thin band around a slanted line, a nearly degenerate input for both engines
+    x = rng.uniform(BOX[0], BOX[2], size=n)
+    y = (BOX[1] + BOX[3]) / 2 + 0.3 * (x - (BOX[0] + BOX[2]) / 2) + rng.normal(scale=1e-3, size=n)
+    return np.column_stack((x, y))
+
+
+def grid_duplicates(n, rng):
+    # a regular grid (every cell vertex is cocircular) with a tenth of the sites repeated
+    unique = max(1, int(n * 0.9))
+    side = int(np.ceil(np.sqrt(unique)))
+    step = (BOX[2] - BOX[0]) / (side + 1)
+    i, j = np.divmod(np.arange(unique), side)
+    grid = np.column_stack((BOX[0] + (i + 1) * step, BOX[1] + (j + 1) * step))
+    duplicates = grid[rng.integers(unique, size=n - unique)]
+    return rng.permutation(np.concatenate((grid, duplicates)))
+
+
+DISTRIBUTIONS = {
+    "uniform": uniform,
+    "clustered": clustered,
+    "near_collinear": near_collinear,
+    "grid_duplicates": grid_duplicates,
+}
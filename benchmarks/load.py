@@ -0,0 +1,208 @@
+"""
+Load test of the delaunay and fortune routes against a running server, e.g. one started with
+
+    python manage.py runserver 127.0.0.1:8000 --noreload
+    gunicorn -c gunicorn.conf.py iLloyd.wsgi
+
+Every client runs sessions the way the frontend's run() loop does: it posts its points, waits the
+delay, and posts the centroids it got back as the next points, for the given number of steps. Each
+client is a process of its own, so decoding responses does not slow the other clients down. For
+every concurrency level the clients keep starting requests for the given duration, and the report
+holds the throughput, latency percentiles and error rate per route:
+
+    python -m benchmarks.load --concurrency 1,4,16 --sizes 1000 --output load.json
+"""
+from multiprocessing import get_context
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import json
+import os
+import sys
+import time
+import numpy as np
+
+ALGORITHMS = ("delaunay", "fortune")
+PERCENTILES = (50, 95, 99)
+
+
+def server_total(header):
+    # the total phase of a Server-Timing header, set by the server when ILLOYD_METRICS is on
+    for entry in (header or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name == "total" and duration:
+            return float(duration)
+    return None
+
+
+class Client:
+    # one keep-alive connection, reopened by http.client when the server closes it
+    def __init__(self, url, binary, timeout):
+        parts = urlsplit(url)
+        self.path = parts.path.rstrip("/") + "/api/"
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.binary = binary
+        if binary:
+            os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iLloyd.settings")
+            from api import wire
+            self.wire = wire
+
+    def post(self, algorithm, points, boundaries):
+        # returns the status, the centroids (None unless it succeeded) and the server side total
+        if self.binary:
+            media_type = self.wire.MEDIA_TYPE
+            body = self.wire.encode({"points": points, "boundaries": boundaries})
+        else:
+            media_type = "application/json"
+            body = json.dumps({"points": points.tolist(), "boundaries": boundaries})
+
+        try:
+            self.connection.request("POST", f"{self.path}{algorithm}/", body, {"Content-Type": media_type, "Accept": media_type})
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            self.connection.close()
+            return type(error).__name__, None, None
+
+        if response.status != 200:
+            return response.status, None, None
+        data = self.wire.decode(content) if self.binary else json.loads(content)
+        return response.status, np.asarray(data["centroids"], dtype=float), server_total(response.getheader("Server-Timing"))
+
+
+def client(settings, seed, connection):
+    # runs in the client process: sessions of settings["iterations"] steps until the deadline. every
+    # sample is (algorithm, start, latency ms, status, server total ms)
+    from benchmarks.distributions import BOX, DISTRIBUTIONS
+
+    rng = np.random.default_rng(seed)
+    boundaries = dict(zip(("min_x", "min_y", "max_x", "max_y"), BOX))
+    session = Client(settings["url"], settings["format"] == "arrays", settings["timeout"])
+    samples = []
+
+    while time.monotonic() < settings["deadline"]:
+        algorithm = settings["algorithms"][rng.integers(len(settings["algorithms"]))]
+        points = DISTRIBUTIONS[settings["distribution"]](settings["size"], rng)
+
+        for _ in range(settings["iterations"]):
+            if time.monotonic() >= settings["deadline"]:
+                break
+            start = time.monotonic()
+            status, centroids, server = session.post(algorithm, points, boundaries)
+            samples.append((algorithm, start, (time.monotonic() - start) * 1000.0, status, server))
+            # a failed step ends the session, the next one starts from fresh points
+            if centroids is None:
+                break
+            points = centroids
+            time.sleep(settings["delay"] / 1000.0)
+
+    connection.send(samples)
+    connection.close()
+
+
+def summarize(samples, elapsed):
+    # throughput of the successful requests, their latency percentiles and the share of failures
+    succeeded = [latency for _, _, latency, status, _ in samples if status == 200]
+    server = [total for _, _, _, status, total in samples if status == 200 and total is not None]
+    statuses = {}
+    for _, _, _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "error_rate": (len(samples) - len(succeeded)) / max(len(samples), 1),
+        "throughput": len(succeeded) / max(elapsed, 1e-9),
+        "statuses": statuses,
+    }
+    if succeeded:
+        summary["latency_ms"] = {"mean": float(np.mean(succeeded)), "max": float(np.max(succeeded)),
+                                 **{f"p{q}": float(np.percentile(succeeded, q)) for q in PERCENTILES}}
+    if server:
+        # what the server spent on the request, the rest of the latency is queueing and transfer
+        summary["server_ms"] = {f"p{q}": float(np.percentile(server, q)) for q in PERCENTILES}
+    return summary
+
+
+def run_level(settings, concurrency, seed):
+    # concurrency client processes started together, the level ends once the last one reported
+    context = get_context("spawn")
+    start = time.monotonic()
+    settings = {**settings, "deadline": start + settings["duration"]}
+    clients = []
+    for index in range(concurrency):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=client, args=(settings, seed + index, sender))
+        process.start()
+        sender.close()
+        clients.append((process, receiver))
+
+    samples = []
+    for process, receiver in clients:
+        try:
+            samples.extend(receiver.recv())
+        except EOFError:
+            # the client died, its requests are lost
+            pass
+        process.join()
+
+    # the clients take a moment to start, the window runs from the first request to the last answer
+    if samples:
+        elapsed = max(begin + latency / 1000.0 for _, begin, latency, _, _ in samples) - min(begin for _, begin, _, _, _ in samples)
+    else:
+        elapsed = time.monotonic() - start
+
+    results = []
+    for algorithm in settings["algorithms"]:
+        mine = [sample for sample in samples if sample[0] == algorithm]
+        results.append({"algorithm": algorithm, "concurrency": concurrency, "size": settings["size"],
+                        "duration_s": elapsed, **summarize(mine, elapsed)})
+    return results
+
+
+def main(argv=None):
+    from benchmarks.distributions import DISTRIBUTIONS
+    from benchmarks.run import environment
+
+    parser = argparse.ArgumentParser(description="Load test the delaunay and fortune routes of a running server.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/", help="base url of the server")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS), help="routes the sessions pick from at random")
+    parser.add_argument("--concurrency", default="1,4,16", help="concurrent clients, one level after the other")
+    parser.add_argument("--sizes", default="1000", help="points per session, one level after the other")
+    parser.add_argument("--distribution", choices=sorted(DISTRIBUTIONS), default="uniform")
+    parser.add_argument("--iterations", type=int, default=10, help="steps of a session, each sends the last centroids")
+    parser.add_argument("--delay", type=float, default=0.0, help="milliseconds a client waits between steps")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds every level starts requests for")
+    parser.add_argument("--format", choices=("json", "arrays"), default="json", help="wire format of request and response")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds before a request counts as failed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    settings = {"url": args.url, "algorithms": args.algorithms.split(","), "distribution": args.distribution,
+                "iterations": args.iterations, "delay": args.delay, "duration": args.duration,
+                "format": args.format, "timeout": args.timeout}
+
+    results = []
+    for size in map(int, args.sizes.split(",")):
+        for concurrency in map(int, args.concurrency.split(",")):
+            for result in run_level({**settings, "size": size}, concurrency, args.seed):
+                results.append(result)
+                latency = result.get("latency_ms")
+                print(f"{result['algorithm']:>8} {size:>8} x{concurrency:<4} {result['throughput']:8.1f} req/s  "
+                      + (" ".join(f"p{q} {latency[f'p{q}']:8.1f}" for q in PERCENTILES) + " ms" if latency else "no successful requests")
+                      + f"  errors {result['error_rate']:.1%}", file=sys.stderr)
+
+    report = {"environment": environment(), "settings": {**settings, "sizes": args.sizes, "concurrency": args.concurrency},
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Benchmarks of the delaunay and fortune views, called in process with a request factory so the
+numbers hold parse, geometry, clipping and serialization time but no network.
+
+Every case runs in a fresh process, so its peak memory is the growth of the process' maximum
+resident set size over the baseline after setup. Results are written as JSON and can be compared
+against an earlier run:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --sizes 100,1000,10000 --compare bench.json
+"""
+from multiprocessing import get_context
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+ALGORITHMS = ("delaunay", "fortune")
+SIZES = (100, 1000, 10000, 100000, 1000000)
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iLloyd.settings")
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.ILLOYD_METRICS = True
+
+
+def max_rss():
+    # bytes on linux, where ru_maxrss is reported in KiB (macos reports bytes)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(case, connection):
+    # runs in the child process: time the view on one point set, repeating while the budget allows
+    try:
+        setup()
+        import numpy as np
+        from rest_framework.test import APIRequestFactory
+        from api import cache, voronoi, wire
+        from benchmarks.distributions import BOX, DISTRIBUTIONS
+
+        points = DISTRIBUTIONS[case["distribution"]](case["size"], np.random.default_rng(case["seed"]))
+        boundaries = dict(zip(("min_x", "min_y", "max_x", "max_y"), BOX))
+        view = getattr(voronoi, case["algorithm"])
+        factory = APIRequestFactory()
+
+        if case["format"] == "arrays":
+            body = wire.encode({"points": points, "boundaries": boundaries})
+            make_request = lambda: factory.post("/", body, content_type=wire.MEDIA_TYPE, HTTP_ACCEPT=wire.MEDIA_TYPE)
+        else:
+            body = json.dumps({"points": points.tolist(), "boundaries": boundaries})
+            make_request = lambda: factory.post("/", body, content_type="application/json")
+
+        baseline = max_rss()
+        runs, counters, status, spent = [], {}, None, 0.0
+        while len(runs) < case["repeat"] and (not runs or spent < case["budget"]):
+            # every run computes the diagram, never a cached result
+            cache.results.clear()
+            request = make_request()
+            response = view(request)
+            status = response.status_code
+            if status != 200:
+                break
+            # large results are streamed, their serialize phase ends with the body
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            runs.append(request.timings.phases)
+            counters = request.timings.counters
+            spent += request.timings.phases["total"] / 1000.0
+
+        result = {"status": status, "runs": len(runs), "peak_rss_bytes": max_rss() - baseline, "counters": counters}
+        if runs:
+            # median of every phase over the runs
+            result["phases_ms"] = {name: float(np.median([run.get(name, 0.0) for run in runs])) for name in runs[0]}
+        else:
+            result["error"] = response.data.get("error") if hasattr(response, "data") else None
+    except Exception as error:
+        result = {"status": None, "error": f"{type(error).__name__}: {error}"}
+
+    connection.send(result)
+    connection.close()
+
+
+def run_case(case, timeout):
+    # a fresh process per case, killed when it runs past the timeout
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure, args=(case, sender))
+    process.start()
+    sender.close()
+
+    if receiver.poll(timeout):
+        result = receiver.recv()
+    else:
+        process.terminate()
+        result = {"status": None, "error": f"timed out after {timeout}s"}
+
+    process.join()
+    return {**case, **result}
+
+
+def scaling(results):
+    # least squares exponent b of diagram_ms ~ (n log n)^b per algorithm and distribution, over the
+    # sizes from 1000 up. b close to 1 means the engine scales as n log n
+    fits = []
+    for algorithm in ALGORITHMS:
+        for distribution in sorted({result["distribution"] for result in results}):
+            samples = [(result["size"], result["phases_ms"]["diagram"]) for result in results
+                       if result["algorithm"] == algorithm and result["distribution"] == distribution
+                       and result["size"] >= 1000 and "phases_ms" in result]
+            if len(samples) < 2:
+                continue
+            xs = [math.log(n * math.log(n)) for n, _ in samples]
+            ys = [math.log(max(duration, 1e-6)) for _, duration in samples]
+            mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+            exponent = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+            fits.append({"algorithm": algorithm, "distribution": distribution, "sizes": [n for n, _ in samples], "exponent": exponent})
+    return fits
+
+
+def compare(results, baseline, threshold):
+    # cases whose total time grew by more than threshold over the baseline run
+    previous = {(r["algorithm"], r["distribution"], r["size"], r["format"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["algorithm"], result["distribution"], result["size"], result["format"]))
+        if old is None or "phases_ms" not in old or "phases_ms" not in result:
+            continue
+        ratio = result["phases_ms"]["total"] / max(old["phases_ms"]["total"], 1e-6)
+        if ratio > threshold:
+            regressions.append({"algorithm": result["algorithm"], "distribution": result["distribution"],
+                                "size": result["size"], "format": result["format"], "ratio": ratio})
+    return regressions
+
+
+def environment():
+    import numpy
+    import scipy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv=None):
+    from benchmarks.distributions import DISTRIBUTIONS
+
+    parser = argparse.ArgumentParser(description="Benchmark the delaunay and fortune views.")
+    parser.add_argument("--algorithms", default=",".join(ALGORITHMS))
+    parser.add_argument("--distributions", default=",".join(DISTRIBUTIONS))
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--format", choices=("json", "arrays"), default="json", help="wire format of request and response")
+    parser.add_argument("--fortune-max-size", type=int, default=100000, help="larger fortune cases are skipped, the sweep is pure python")
+    parser.add_argument("--repeat", type=int, default=5, help="most runs per case, the median is reported")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds after which a case stops repeating")
+    parser.add_argument("--timeout", type=float, default=900.0, help="seconds before a case is killed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression")
+    parser.add_argument("--max-exponent", type=float, help="fail when a fortune scaling exponent exceeds this")
+    args = parser.parse_args(argv)
+
+    results = []
+    for algorithm in args.algorithms.split(","):
+        for distribution in args.distributions.split(","):
+            for size in map(int, args.sizes.split(",")):
+                case = {"algorithm": algorithm, "distribution": distribution, "size": size, "format": args.format,
+                        "seed": args.seed, "repeat": args.repeat, "budget": args.budget}
+                if algorithm == "fortune" and size > args.fortune_max_size:
+                    results.append({**case, "status": None, "skipped": "above --fortune-max-size"})
+                    continue
+
+                result = run_case(case, args.timeout)
+                results.append(result)
+                total = result.get("phases_ms", {}).get("total")
+                print(f"{algorithm:>8} {distribution:>15} {size:>8}: "
+                      + (f"{total:10.1f} ms  {result['peak_rss_bytes'] / 2 ** 20:8.1f} MiB" if total is not None else result.get("error")),
+                      file=sys.stderr)
+
+    report = {"environment": environment(), "results": results, "scaling": scaling(results)}
+    failed = False
+
+    if args.max_exponent is not None:
+        for fit in report["scaling"]:
+            if fit["algorithm"] == "fortune" and fit["exponent"] > args.max_exponent:
+                print(f"fortune on {fit['distribution']} scales as (n log n)^{fit['exponent']:.2f}", file=sys.stderr)
+                failed = True
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            report["regressions"] = compare(results, json.load(baseline), args.threshold)
+        for regression in report["regressions"]:
+            print("regression: {algorithm} {distribution} {size} ({format}) is {ratio:.2f}x slower".format(**regression), file=sys.stderr)
+        failed = failed or bool(report["regressions"])
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
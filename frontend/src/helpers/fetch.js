@@ -1,28 +1,43 @@
-
+import { ARRAY_MEDIA_TYPE, encodeArrays, decodeArrays } from './wire';
 
 const URL = 'http://0.0.0.0:8000/';
 
 /**
  * Send data using the Fetch API
- * 
+ *
  * @param {string} url the URL to which the data will be sent
  * @param {Object} data the data object to be sent
  * @param {string} method the HTTP method ('POST', 'PUT', 'PATCH', etc.)
+ * @param {boolean} binary send and receive point arrays in the binary array format instead of JSON
  * @returns {Promise<Object>} returns a promise that resolves to the server response as a JSON object
  */
-const fetchData = async (path, method, data) => {
+const fetchData = async (path, method, data, binary = false) => {
     try {
+        const contentType = binary ? ARRAY_MEDIA_TYPE : 'application/json';
         const response = await fetch( URL + path, {
             method: method,
             mode: 'cors',
             headers: {
-                'Content-Type': 'application/json',
+                'Content-Type': contentType,
+                'Accept': contentType,
             },
-            body: JSON.stringify(data),
+            body: binary ? encodeArrays(data) : JSON.stringify(data),
         });
 
         if (response.ok) {
-            const responseData = await response.json();
+            if (!binary) {
+                const responseData = await response.json();
+                return responseData;
+            }
+
+            const responseData = decodeArrays(await response.arrayBuffer());
+
+            // the binary format leaves out centroid edges, they pair every point with its centroid
+            if (responseData.centroids && !responseData.centroid_edges) {
+                responseData.centroid_edges = responseData.centroids.length === responseData.points.length
+                    ? responseData.points.map((point, i) => [point, responseData.centroids[i]])
+                    : [];
+            }
             return responseData;
         }
         console.error(`HTTP error! Status: ${response.status}`);
@@ -34,4 +49,4 @@ const fetchData = async (path, method, data) => {
 };
 
 
-export default fetchData;
\ No newline at end of file
+export default fetchData;
@@ -0,0 +1,67 @@
+const URL = 'http://0.0.0.0:8000/';
+
+/**
+ * POST data and read the server-sent events of the response as they arrive
+ *
+ * @param {string} path the API path the data will be sent to
+ * @param {Object} data the data object to be sent
+ * @param {function(string, Object): (void|Promise<void>)} onEvent called with the name and payload of every event
+ * @returns {Promise<boolean>} resolves to true once the stream ended, false on error
+ */
+const streamData = async (path, data, onEvent) => {
+    try {
+        const response = await fetch( URL + path, {
+            method: 'POST',
+            mode: 'cors',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify(data),
+        });
+
+        if (!response.ok) {
+            console.error(`HTTP error! Status: ${response.status}`);
+            return false;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // events are separated by a blank line
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                const chunk = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let name = 'message';
+                let payload = '';
+                chunk.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        name = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        payload += line.slice(6);
+                    }
+                });
+                await onEvent(name, JSON.parse(payload));
+
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+        return true;
+    } catch (error) {
+        console.error(`Stream error:, ${error}`);
+        return false;
+    }
+};
+
+
+export default streamData;
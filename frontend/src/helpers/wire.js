@@ -0,0 +1,111 @@
+// binary payload shared with api/wire.py: magic, little-endian uint32 header length, JSON header,
+// then raw little-endian array buffers, each aligned to 8 bytes
+export const ARRAY_MEDIA_TYPE = 'application/x-illoyd-arrays';
+
+const MAGIC = [0x49, 0x4c, 0x59, 0x44]; // "ILYD"
+const ALIGNMENT = 8;
+const TYPED_ARRAYS = {
+    '<f8': Float64Array,
+    '<f4': Float32Array,
+    '<i4': Int32Array,
+    '<u4': Uint32Array,
+    '|u1': Uint8Array,
+};
+
+const aligned = (size) => Math.ceil(size / ALIGNMENT) * ALIGNMENT;
+
+
+/**
+ * Flatten a list of equally sized number lists, e.g. [[x, y], ...], into a Float64Array
+ *
+ * @param {Array<Array<number>>} rows the nested list
+ * @returns {{array: Float64Array, shape: Array<number>}} the flat array and its shape
+ */
+const flatten = (rows) => {
+    const width = rows[0].length;
+    const array = new Float64Array(rows.length * width);
+    rows.forEach((row, i) => array.set(row, i * width));
+    return { array, shape: [rows.length, width] };
+};
+
+
+/**
+ * Rebuild nested lists from a flat typed array, the shape the canvas draws from
+ *
+ * @param {TypedArray} flat the flat array
+ * @param {Array<number>} shape the array shape
+ * @returns {Array} nested lists
+ */
+const nest = (flat, shape) => {
+    if (shape.length <= 1) {
+        return Array.from(flat);
+    }
+    const step = flat.length / shape[0];
+    const rows = [];
+    for (let i = 0; i < shape[0]; i++) {
+        rows.push(nest(flat.subarray(i * step, (i + 1) * step), shape.slice(1)));
+    }
+    return rows;
+};
+
+
+/**
+ * Encode an object into the binary payload, non-empty lists of number lists are sent as float64 arrays
+ *
+ * @param {Object} data the request object
+ * @returns {ArrayBuffer} the encoded payload
+ */
+export const encodeArrays = (data) => {
+    const fields = {};
+    const arrays = {};
+    const layout = {};
+    let offset = 0;
+
+    Object.entries(data).forEach(([name, value]) => {
+        if (Array.isArray(value) && value.length > 0 && Array.isArray(value[0])) {
+            arrays[name] = flatten(value);
+            layout[name] = { dtype: '<f8', shape: arrays[name].shape, offset: offset };
+            offset += aligned(arrays[name].array.byteLength);
+        } else {
+            fields[name] = value;
+        }
+    });
+
+    const header = new TextEncoder().encode(JSON.stringify({ fields: fields, arrays: layout }));
+    const start = aligned(8 + header.length);
+    const bytes = new Uint8Array(start + offset);
+
+    bytes.set(MAGIC, 0);
+    new DataView(bytes.buffer).setUint32(4, header.length, true);
+    bytes.set(header, 8);
+
+    // typed arrays use the platform byte order, which is little-endian on every browser we target
+    Object.entries(arrays).forEach(([name, { array }]) => {
+        bytes.set(new Uint8Array(array.buffer), start + layout[name].offset);
+    });
+
+    return bytes.buffer;
+};
+
+
+/**
+ * Decode a binary payload back into a plain object with nested lists
+ *
+ * @param {ArrayBuffer} buffer the payload
+ * @returns {Object} the decoded object
+ */
+export const decodeArrays = (buffer) => {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const start = aligned(8 + headerLength);
+    const data = { ...header.fields };
+
+    Object.entries(header.arrays).forEach(([name, { dtype, shape, offset }]) => {
+        const TypedArray = TYPED_ARRAYS[dtype];
+        const count = shape.reduce((a, b) => a * b, 1);
+        data[name] = nest(new TypedArray(buffer, start + offset, count), shape);
+    });
+
+    return data;
+};
@@ -3,9 +3,17 @@ import { useCanvas } from './canvas_context';
 import '../styles/canvas.css';
 import Toggle from '../components/toggle';
 import fetchData from '../helpers/fetch';
+import streamData from '../helpers/stream';
 import sleep from '../helpers/sleep';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
-import { faSearchPlus, faSearchMinus, faSync, faPlay, faTrash } from '@fortawesome/free-solid-svg-icons';
+import { faSearchPlus, faSearchMinus, faSync, faPlay, faForward, faTrash } from '@fortawesome/free-solid-svg-icons';
+
+
+// an empty or invalid delay means no delay
+function parseDelay(value) {
+    const delay = parseInt(value, 10);
+    return isNaN(delay) ? 0 : Math.max(delay, 0);
+}
 
 
 function CanvasDisplay() {
@@ -14,7 +22,9 @@ function CanvasDisplay() {
 
     const [inputPointValue, setInputPointValue] = useState('');
     const [inputDelayValue, setInputDelayValue] = useState('');
+    const [inputIterationValue, setInputIterationValue] = useState('');
     const [algorithm, setAlgorithm] = useState('delaunay');
+    const [method, setMethod] = useState('lloyd');
     
 
     async function delayedExecution(milliseconds) {
@@ -79,9 +89,19 @@ function CanvasDisplay() {
     };
 
 
+    const handleInputIterationChange = (e) => {
+        setInputIterationValue(e.target.value);
+    };
+
+
     const handleAlgorithmChange = (e) => {
         setAlgorithm(e.target.value);
     };
+
+
+    const handleMethodChange = (e) => {
+        setMethod(e.target.value);
+    };
     
 
     const clear = () => {
@@ -91,7 +111,7 @@ function CanvasDisplay() {
 
     const run = async () => {
         
-        const millisecondDelay = parseInt(inputDelayValue, 10);
+        const millisecondDelay = parseDelay(inputDelayValue);
         var start = new Date();
         
         const apiEndpoint = algorithm === 'delaunay' ? 'api/delaunay/' : 'api/fortune/';
@@ -120,6 +140,36 @@ function CanvasDisplay() {
         await Promise.resolve();
     };
 
+
+    const stream = async () => {
+
+        const millisecondDelay = parseDelay(inputDelayValue);
+        const iterations = parseInt(inputIterationValue, 10);
+
+        if (isNaN(iterations)) {
+            alert('Please enter a valid number of iterations');
+            return;
+        }
+
+        const rect = canvasRef.current.getBoundingClientRect();
+        const width = rect.width / scale;
+        const height = rect.height / scale;
+
+        // the server relaxes all iterations in one request and pushes every step as soon as it is ready
+        const ok = await streamData('api/relax/stream/', {"points": data.points, "boundaries": { "min_x": 0, "max_x": width, "min_y": 0, "max_y": height }, "iterations": iterations, "method": method, "edges": true}, async (event, payload) => {
+            if (event === 'iteration') {
+                setData({"points": payload.points, "edges": payload.edges, "lastPosition": [], "centroids": [], "centroidEdges": []});
+                await delayedExecution(millisecondDelay);
+            } else if (event === 'error') {
+                alert(payload.error);
+            }
+        });
+
+        if (!ok) {
+            alert("Something went wrong!");
+        }
+    };
+
     return (
         <div className="control-panel">
             <input
@@ -137,6 +187,13 @@ function CanvasDisplay() {
                 onChange={handleInputDelayChange}
                 placeholder="Delay"
             />
+            <input
+                type="text"
+                className="small-input"
+                value={inputIterationValue}
+                onChange={handleInputIterationChange}
+                placeholder="Steps"
+            />
             <div className="control-panel">
                 <button className="visual-button" onClick={zoomIn} title="Zoom In">
                     <FontAwesomeIcon icon={faSearchPlus} />
@@ -159,6 +216,15 @@ function CanvasDisplay() {
             <button className="visual-button" onClick={run} title="Run">
                 <FontAwesomeIcon icon={faPlay} />
             </button>
+            <select value={method} onChange={handleMethodChange}>
+                <option value="lloyd">Lloyd</option>
+                <option value="overrelaxation">Over-relaxation</option>
+                <option value="anderson">Anderson</option>
+                <option value="lbfgs">L-BFGS</option>
+            </select>
+            <button className="visual-button" onClick={stream} title="Relax">
+                <FontAwesomeIcon icon={faForward} />
+            </button>
         </div>
     );
 }
@@ -0,0 +1,32 @@
+# gunicorn settings for the geometry service: gunicorn -c gunicorn.conf.py iLloyd.wsgi
+# ILLOYD_BIND, ILLOYD_WORKERS and ILLOYD_TIMEOUT override the defaults below
+import os
+import time
+
+started = time.perf_counter()
+
+bind = os.environ.get("ILLOYD_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("ILLOYD_WORKERS", os.cpu_count() or 1))
+# every worker starts its own geometry pool for the batch and tiled views, they share the cores
+# instead of each taking all of them (set before the app is loaded, the workers inherit it)
+os.environ["ILLOYD_SERVER_WORKERS"] = str(workers)
+# large diagrams take a while, the sync workers hold their request until it is done
+timeout = int(os.environ.get("ILLOYD_TIMEOUT", 120))
+
+# django, numpy and scipy are imported once by the master, the workers share those pages after the
+# fork instead of each importing them again
+preload_app = True
+
+
+def when_ready(server):
+    # the master has loaded the app and warms it up before forking, so every worker starts warm
+    from api import startup
+    durations = startup.warm_up()
+    server.log.info("boot %.1f ms (geometry imports %.1f ms), warm-up %.1f ms",
+                    (time.perf_counter() - started) * 1000.0, durations["imports"], durations["warmup"])
+
+
+def post_worker_init(worker):
+    # without preloading every worker warms up itself before it accepts requests
+    from api import startup
+    startup.warm_up()
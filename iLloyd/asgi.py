@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "iLloyd.settings")
 
 application = get_asgi_application()
+
+# geometry of the api/async/ views runs in a pool of worker processes, started here so the first
+# request finds them warm. requests are cancelled when their client disconnects, which cancels their jobs
+from api import executor  # noqa: E402
+
+executor.pool.start()
+application = executor.cancel_on_disconnect(application)
@@ -63,6 +63,24 @@ CORS_ALLOWED_ORIGINS = [
     'http://127.0.0.1:3000',
 ]
 
+CORS_EXPOSE_HEADERS = [
+    'Server-Timing',
+]
+
+REST_FRAMEWORK = {
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'api.wire.ArrayParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.wire.ArrayRenderer',
+    ],
+}
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -133,3 +151,78 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Geometry service instrumentation: per-phase Server-Timing headers and the api/metrics/ histograms
+
+ILLOYD_METRICS = False
+
+# Clients allowed to read api/metrics/ besides staff users. behind a reverse proxy every request
+# comes from the proxy's address, leave it out there (e.g. set this to []) and rely on staff logins
+
+ILLOYD_METRICS_ADDRESSES = ["127.0.0.1", "::1"]
+
+# Relaxation sessions are kept in worker memory: total size cap and idle timeout before eviction
+
+ILLOYD_SESSION_MAX_BYTES = 256 * 1024 * 1024
+
+ILLOYD_SESSION_IDLE_SECONDS = 600
+
+# Diagram results cached by content hash: per-worker LRU size cap, and an optional CACHES alias
+# (e.g. a memcached or redis backend) to share entries between workers
+
+ILLOYD_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+ILLOYD_RESULT_CACHE_ALIAS = None
+
+ILLOYD_RESULT_CACHE_TIMEOUT = 3600
+
+# Worker processes for the geometry of the api/async/, api/batch/ and api/tiled/ views: pool size,
+# pending job limit before requests are turned away with 503 (None for 4 per worker), per-job timeout
+# in seconds, and the work (points times iterations) below which a job runs inline on a thread.
+# Every server process (each gunicorn worker) starts a pool of its own, so a fixed size is multiplied
+# by the number of server processes. None divides the cores among them: gunicorn.conf.py passes its
+# worker count on as the ILLOYD_SERVER_WORKERS environment variable, set it yourself for other
+# multi-process servers
+
+ILLOYD_POOL_WORKERS = None
+
+ILLOYD_POOL_MAX_PENDING = None
+
+ILLOYD_POOL_TIMEOUT = 60
+
+ILLOYD_POOL_INLINE_POINTS = 2000
+
+# Most sites a tile of the api/tiled/ view holds (without its ghost sites), bounding worker memory
+
+ILLOYD_TILE_SITES = 250000
+
+# Uploaded densities and their prefix tables, kept by content hash: per-worker LRU size cap, and an
+# optional CACHES alias to share them between workers (entries are about four times the raster size)
+
+ILLOYD_DENSITY_MAX_BYTES = 256 * 1024 * 1024
+
+ILLOYD_DENSITY_CACHE_ALIAS = None
+
+ILLOYD_DENSITY_CACHE_TIMEOUT = 24 * 3600
+
+# Uploaded polygonal domains kept by content hash as their geometry: per-worker LRU size cap and an
+# optional CACHES alias to share them, and how many prepared domains (geometry, pieces and STRtree)
+# a worker keeps so that requests naming them skip the preparation
+
+ILLOYD_DOMAIN_MAX_BYTES = 64 * 1024 * 1024
+
+ILLOYD_DOMAIN_CACHE_ALIAS = None
+
+ILLOYD_DOMAIN_CACHE_TIMEOUT = 24 * 3600
+
+ILLOYD_DOMAIN_PREPARED = 16
+
+# Responses whose arrays hold at least this many rows are streamed in chunks instead of being
+# rendered in one piece
+
+ILLOYD_STREAM_MIN_ROWS = 10000
+
+# Import the views and run a small diagram of every kind when the api app is ready, so the first
+# request of a worker does not pay for lazy loading (gunicorn.conf.py warms up regardless)
+
+ILLOYD_WARMUP = False